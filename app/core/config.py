@@ -1,7 +1,13 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Dict, Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+import atexit
+import json
 import logging
-import os
+import logging.handlers
+import queue
+import random
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Agentic Agriculture RAG API"
@@ -16,8 +22,76 @@ class Settings(BaseSettings):
     
     # Model Configuration
     GROQ_MODEL: str = "llama-3.3-70b-versatile"
+    GROQ_FAST_MODEL: str = "llama-3.1-8b-instant"
     EMBEDDING_MODEL: str = "BAAI/bge-large-en-v1.5"
     
+    # Embedding Service ("local" loads the model in-process, "remote" uses the shared embedding server)
+    EMBEDDING_SERVICE_MODE: str = "local"
+    EMBEDDING_SERVICE_ADDRESS: str = "./db/embedding.sock"
+    EMBEDDING_SERVICE_AUTHKEY: str = ""  # Empty: the server generates a key into EMBEDDING_SERVICE_KEY_PATH
+    EMBEDDING_SERVICE_KEY_PATH: str = "./db/embedding.key"
+    QUERY_EMBEDDING_CACHE_SIZE: int = 1024
+    
+    # Embedding Micro-Batching (concurrent embed calls share one forward pass)
+    EMBEDDING_BATCHING: bool = False
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    
+    # Local Chunk Store (chunk text lives here; the vector index keeps IDs and filter fields)
+    CHUNK_STORE_PATH: str = "./db/chunks.sqlite3"
+    CHUNK_CACHE_SIZE: int = 2048
+    CONDENSED_CONTEXT: bool = True  # Prompt with the ingest-time condensed chunk text when available
+    
+    # Vector Index Layout ("filter": one namespace + metadata filter, "namespace": one namespace per knowledge base and source)
+    INDEX_LAYOUT: str = "filter"
+    
+    # Learned Knowledge Lifecycle (enforced by scripts/compact_learned.py)
+    LEARNED_TTL_DAYS: float = 180
+    LEARNED_COLD_DAYS: float = 30
+    LEARNED_MAX_CHUNKS: int = 5000
+    LEARNED_ARCHIVE: bool = True
+    LEARNED_HIT_FLUSH_SECONDS: float = 10
+    
+    # MCP Server
+    MCP_MAX_CONCURRENCY: int = 4
+    MCP_MAX_QUEUE: int = 32
+    MCP_BATCH_MAX_QUESTIONS: int = 20
+    
+    # Graph Optimisations
+    SPECULATIVE_RETRIEVAL: bool = False
+    SPECULATIVE_SEARCH: bool = False
+    SPECULATIVE_SEARCH_MIN_SCORE: float = 0.55
+    SPECULATIVE_SEARCH_MAX_SCORE: float = 0.75
+    SPECULATIVE_SEARCH_BUDGET_PER_REQUEST: float = 0.25
+    SPECULATIVE_SEARCH_MAX_BALANCE: float = 10.0
+    
+    # Generation Model Routing (empty policy uses the built-in table in app/services/llm/router.py)
+    GENERATION_ROUTING: bool = False
+    GENERATION_ROUTING_POLICY: List[Dict[str, Any]] = []
+    
+    # Upstream Resilience (per-request deadline, per-dependency timeouts, hedging, circuit breakers)
+    REQUEST_DEADLINE_SECONDS: float = 45.0
+    UPSTREAM_TIMEOUTS: Dict[str, float] = {"groq": 30.0, "groq_fast": 10.0, "pinecone": 5.0, "tavily": 10.0}
+    # Worker threads per dependency, abandoned timed-out calls included (bulkheads)
+    UPSTREAM_CONCURRENCY: Dict[str, int] = {"groq": 16, "groq_fast": 16, "pinecone": 16, "tavily": 8}
+    UPSTREAM_DEFAULT_CONCURRENCY: int = 8
+    HEDGED_DEPENDENCIES: List[str] = ["pinecone", "groq_fast"]
+    HEDGE_PERCENTILE: float = 95.0
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+    
+    # Graph Run Cassettes (record upstream calls for offline replay)
+    CASSETTE_RECORD: bool = False
+    CASSETTE_DIR: str = "./db/cassettes"
+    CASSETTE_MAX_BYTES: int = 50_000_000
+    CASSETTE_BACKUPS: int = 5
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text" # "text" or "json"
+    LOG_ASYNC: bool = True # Hand records to a background thread instead of writing on the caller's thread
+    LOG_SAMPLING: Dict[str, float] = {} # Logger category -> fraction of INFO/DEBUG lines kept, e.g. {"http": 0.1}
+    
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
     
@@ -30,12 +104,90 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
+# Correlation IDs attached to every log record emitted while they are bound
+log_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+
+@contextmanager
+def bind_log_context(**fields):
+    """Binds correlation fields (e.g. request_id, session_id) for log lines in this context."""
+    token = log_context.set({**log_context.get(), **{k: v for k, v in fields.items() if v}})
+    try:
+        yield
+    finally:
+        log_context.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Copies the bound correlation IDs onto the record. Runs on the caller's thread."""
+    def filter(self, record):
+        context = log_context.get()
+        record.request_id = context.get("request_id", "-")
+        record.session_id = context.get("session_id", "-")
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of INFO/DEBUG lines per category; warnings and errors always pass."""
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {f"agri-cult.{category}": rate for category, rate in rates.items()}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "session_id": getattr(record, "session_id", "-"),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves message formatting to the listener thread.
+    The stock handler formats in prepare(), i.e. on the event loop.
+    """
+    def prepare(self, record):
+        return record
+
 # Configure Logging
 def setup_logging():
-    logging.basicConfig(
-        level=os.getenv("LOG_LEVEL", "INFO"),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s/%(session_id)s] %(message)s"
+        ))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    if settings.LOG_ASYNC:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        handler = DeferredQueueHandler(log_queue)
+
+    handler.addFilter(ContextFilter())
+    if settings.LOG_SAMPLING:
+        handler.addFilter(SamplingFilter(settings.LOG_SAMPLING))
+    root.addHandler(handler)
     return logging.getLogger("agri-cult")
 
+def get_logger(category: str) -> logging.Logger:
+    """Logger for a sampling category, e.g. get_logger("http") -> 'agri-cult.http'."""
+    return logging.getLogger(f"agri-cult.{category}")
+
 logger = setup_logging()
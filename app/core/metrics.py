@@ -0,0 +1,67 @@
+"""
+In-process metrics registry.
+Counters and latency observations exposed through the /metrics endpoint.
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any, Optional
+
+
+class Metrics:
+    """Thread-safe counters plus a sliding window of observations per metric."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._totals: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._samples[name].append(value)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+            self._totals.clear()
+
+    def percentile(self, name: str, pct: float) -> Optional[float]:
+        """Percentile over the recent window, or None when nothing has been observed yet."""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: sorted(window) for name, window in self._samples.items()}
+            totals = {name: list(values) for name, values in self._totals.items()}
+
+        observations = {}
+        for name, window in samples.items():
+            if not window:
+                continue
+            count, total = totals[name]
+            observations[name] = {
+                "count": count,
+                "mean": round(total / count, 3),
+                "p50": window[len(window) // 2],
+                "p95": window[min(len(window) - 1, int(len(window) * 0.95))],
+                "max": window[-1],
+            }
+        return {"counters": counters, "observations": observations}
+
+
+metrics = Metrics()
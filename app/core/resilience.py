@@ -0,0 +1,191 @@
+"""
+Deadlines, timeouts, hedged requests and circuit breakers for upstream dependencies.
+
+Every Groq, Pinecone and Tavily call goes through `call_upstream`, which:
+- fails fast while the dependency's circuit breaker is open,
+- bounds the call by the dependency's timeout and the request's remaining deadline,
+- optionally fires a second (hedged) request once the first has been slower than
+  the dependency's recent latency percentile, and takes whichever returns first.
+Timed-out calls can't be killed; their worker threads finish in the background.
+Each dependency gets its own bounded pool (bulkhead), so a hanging one can only tie
+up its own threads.
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings, logger
+from app.core.metrics import metrics
+
+class CircuitOpenError(RuntimeError):
+    """The dependency is marked unhealthy; the call was not attempted."""
+
+class DeadlineExceeded(TimeoutError):
+    """The call did not finish within its timeout or the request's remaining budget."""
+
+class BulkheadFull(RuntimeError):
+    """Every worker of the dependency's pool is busy, typically with abandoned slow calls."""
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one probe call through after a cool-down."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether a call could currently be attempted, without claiming the half-open probe."""
+        with self._lock:
+            return self.state != "open" or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def release(self):
+        """Hands back a claimed half-open probe when the call was never made."""
+        with self._lock:
+            if self.state == "half_open":
+                # opened_at is unchanged, so the next call may probe straight away
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("Circuit breaker for %s opened after %d failures", self.name, self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)) if self.state == "open" else 0.0
+            return {"state": self.state, "consecutive_failures": self.failures, "retry_in_seconds": round(retry_in, 1)}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_SECONDS)
+        return _breakers[name]
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+def new_deadline() -> float:
+    """Absolute deadline (epoch seconds) for a request starting now."""
+    return time.time() + settings.REQUEST_DEADLINE_SECONDS
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.time()
+
+class Bulkhead:
+    """Per-dependency worker pool. Calls in flight (abandoned ones included) are capped at its size."""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self._pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"upstream-{name}")
+        self._slots = threading.BoundedSemaphore(size)
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise BulkheadFull(f"{self.name} has {self.size} calls in flight")
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+_bulkheads: Dict[str, Bulkhead] = {}
+
+def get_bulkhead(name: str) -> Bulkhead:
+    with _breakers_lock:
+        if name not in _bulkheads:
+            _bulkheads[name] = Bulkhead(name, settings.UPSTREAM_CONCURRENCY.get(name, settings.UPSTREAM_DEFAULT_CONCURRENCY))
+        return _bulkheads[name]
+
+def _hedge_delay(name: str) -> Optional[float]:
+    if name not in settings.HEDGED_DEPENDENCIES:
+        return None
+    latency_ms = metrics.percentile(f"upstream.{name}.latency_ms", settings.HEDGE_PERCENTILE)
+    return None if latency_ms is None else latency_ms / 1000
+
+def call_upstream(name: str, fn: Callable, *args, deadline: Optional[float] = None, **kwargs) -> Any:
+    """Calls a dependency under its breaker, bulkhead, timeout and hedging policy."""
+    # Check the budget before allow(): a claimed half-open probe must end in a recorded outcome.
+    timeout = settings.UPSTREAM_TIMEOUTS.get(name, settings.REQUEST_DEADLINE_SECONDS)
+    budget = remaining(deadline)
+    if budget is not None:
+        if budget <= 0:
+            raise DeadlineExceeded(f"No time left in the request budget for {name}")
+        timeout = min(timeout, budget)
+
+    breaker = get_breaker(name)
+    if not breaker.allow():
+        metrics.incr(f"upstream.{name}.short_circuited")
+        raise CircuitOpenError(f"{name} is unavailable (circuit open)")
+
+    bulkhead = get_bulkhead(name)
+    start = time.perf_counter()
+    try:
+        futures = [bulkhead.submit(fn, *args, **kwargs)]
+    except BulkheadFull:
+        # Our own capacity limit, not an upstream failure: the breaker doesn't count it
+        breaker.release()
+        metrics.incr(f"upstream.{name}.rejected")
+        raise
+    hedge_after = _hedge_delay(name)
+    if hedge_after is not None and hedge_after < timeout:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            try:
+                futures.append(bulkhead.submit(fn, *args, **kwargs))
+                metrics.incr(f"upstream.{name}.hedged")
+            except BulkheadFull:
+                pass
+
+    error = None
+    pending = set(futures)
+    while pending:
+        left = timeout - (time.perf_counter() - start)
+        if left <= 0:
+            break
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                latency_ms = (time.perf_counter() - start) * 1000
+                metrics.observe(f"upstream.{name}.latency_ms", latency_ms)
+                if future is not futures[0]:
+                    metrics.incr(f"upstream.{name}.hedge_wins")
+                breaker.record_success()
+                return future.result()
+            error = error or future.exception()
+
+    breaker.record_failure()
+    metrics.incr(f"upstream.{name}.failures")
+    if error is not None and not pending:
+        raise error
+    metrics.incr(f"upstream.{name}.timeouts")
+    raise DeadlineExceeded(f"{name} did not respond within {timeout:.1f}s")
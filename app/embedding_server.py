@@ -0,0 +1,21 @@
+"""
+Embedding Server Entry Point for Agri-Cult.
+Loads the embedding model once per host and serves vectors to API workers
+started with EMBEDDING_SERVICE_MODE=remote.
+"""
+
+from langchain_huggingface import HuggingFaceEmbeddings
+from app.services.retrieval.embedding_service import EmbeddingServer, with_batching
+from app.core.config import settings, logger
+
+def main():
+    logger.info("Loading embedding model %s", settings.EMBEDDING_MODEL)
+    # Requests from all API workers share the batcher, so batches form across processes
+    embeddings = with_batching(HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL))
+    EmbeddingServer(embeddings).serve_forever()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("Embedding server stopped")
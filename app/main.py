@@ -4,10 +4,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.schemas.query import QueryRequest, QueryResponse, FeedbackRequest, FeedbackResponse
 from app.services.graph.workflow import app_graph
-from app.services.retrieval.retriever import PineconeRetriever
-from app.core.config import settings, logger
+from app.services.graph.cassette import recording
+from app.services.retrieval.retriever import get_retriever
+from app.services.retrieval.embedding_service import embedding_server_metrics
+from app.core.config import settings, logger, get_logger, bind_log_context, log_context
+from app.core.metrics import metrics
+from app.core.resilience import breaker_states, call_upstream, new_deadline
 from app.api.v1.endpoints.dashboard import router as dashboard_router
+import asyncio
 import time
+import uuid
+
+http_logger = get_logger("http")
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -33,16 +41,18 @@ app.include_router(dashboard_router, prefix="/api/v1/dashboard", tags=["Dashboar
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
-    response = await call_next(request)
-    process_time = (time.time() - start_time) * 1000
-    formatted_process_time = "{0:.2f}".format(process_time)
-    logger.info(f"path={request.url.path} method={request.method} status_code={response.status_code} duration={formatted_process_time}ms")
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    with bind_log_context(request_id=request_id):
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        process_time = (time.time() - start_time) * 1000
+        http_logger.info("path=%s method=%s status_code=%s duration=%.2fms", request.url.path, request.method, response.status_code, process_time)
     return response
 
 # Global Exception Handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global exception: {str(exc)}", exc_info=True)
+    logger.error("Global exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"success": False, "detail": "An internal server error occurred. Please check logs for details."},
@@ -56,14 +66,35 @@ async def root():
         "version": settings.VERSION
     }
 
+@app.get("/metrics", tags=["Health"])
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    # In remote mode embedding batching happens in the embedding server process
+    server = await asyncio.to_thread(embedding_server_metrics)
+    if server is not None:
+        snapshot["embedding_server"] = server
+    return snapshot
+
+@app.get("/health/breakers", tags=["Health"])
+async def get_breakers():
+    return breaker_states()
+
 @app.post("/query", response_model=QueryResponse, tags=["Agent"])
 async def query_agent(request: QueryRequest):
     try:
-        logger.info(f"Processing query for session: {request.session_id or 'default'}")
-        initial_state = {"question": request.question}
-        config = {"configurable": {"thread_id": request.session_id or "default-session"}}
+        session_id = request.session_id or "default-session"
+        logger.info("Processing query for session: %s", request.session_id or 'default')
+        initial_state = {
+            "question": request.question,
+            "request_id": log_context.get().get("request_id"),
+            "session_id": session_id,
+            "deadline": new_deadline()
+        }
+        config = {"configurable": {"thread_id": session_id}}
         
-        final_state = app_graph.invoke(initial_state, config=config)
+        # Run the graph off the event loop so a slow upstream can't stall other requests
+        with bind_log_context(session_id=session_id), recording(request.question, session_id):
+            final_state = await asyncio.to_thread(app_graph.invoke, initial_state, config=config)
         
         return QueryResponse(
             success=True,
@@ -72,38 +103,41 @@ async def query_agent(request: QueryRequest):
             sources=final_state.get("sources", [])
         )
     except Exception as e:
-        logger.error(f"Query Error: {str(e)}")
+        logger.error("Query Error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to process query")
 
 @app.post("/feedback", response_model=FeedbackResponse, tags=["Feedback"])
 async def post_feedback(request: FeedbackRequest):
     try:
-        retriever = PineconeRetriever()
+        retriever = get_retriever()
         
         if not request.is_satisfied:
             if request.correct_info:
-                logger.info(f"Learning from user correction: {request.session_id}")
-                retriever.add_learned_knowledge(
+                logger.info("Learning from user correction: %s", request.session_id)
+                await asyncio.to_thread(
+                    retriever.add_learned_knowledge,
                     request.correct_info, 
                     f"User Correction (Session: {request.session_id})", 
                     "hybrid"
                 )
                 return FeedbackResponse(success=True, message="Thank you for the correction! I have learned this for future queries.")
             else:
-                logger.info(f"Triggering automated learning for: {request.question}")
+                logger.info("Triggering automated learning for: %s", request.question)
                 from langchain_community.tools.tavily_search import TavilySearchResults
                 search = TavilySearchResults(max_results=1)
-                search_results = search.invoke(request.question)
+                search_results = await asyncio.to_thread(
+                    call_upstream, "tavily", search.invoke, request.question, deadline=new_deadline()
+                )
                 
                 if search_results:
                     learned_content = search_results[0].get("content", "")
                     url = search_results[0].get("url", "")
-                    retriever.add_learned_knowledge(learned_content, url, "hybrid")
+                    await asyncio.to_thread(retriever.add_learned_knowledge, learned_content, url, "hybrid")
                     return FeedbackResponse(success=True, message="I've learned more about this topic to improve!")
         
         return FeedbackResponse(success=True, message="Thanks for your feedback!")
     except Exception as e:
-        logger.error(f"Feedback Error: {str(e)}")
+        logger.error("Feedback Error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to record feedback")
 
 if __name__ == "__main__":
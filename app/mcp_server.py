@@ -4,16 +4,117 @@ This script allows the Agentic Agriculture RAG to be used as a Model Context Pro
 """
 
 import asyncio
+import uuid
+from contextlib import asynccontextmanager
 from mcp.server.models import InitializationOptions
 from mcp.server import Notification, Server
 from mcp.server.stdio import stdio_server
 import mcp.types as types
 from app.services.graph.workflow import app_graph
-from app.core.config import settings, logger
+from app.services.graph.cassette import recording
+from app.services.retrieval.embedding_service import get_embeddings
+from app.core.config import settings, get_logger, bind_log_context
+from app.core.resilience import new_deadline
+
+logger = get_logger("mcp")
+
+# Upper bound on graph nodes in one run (classify, retrieve, search, generate), used as the progress total.
+NODES_PER_RUN = 4
+
+class ToolLimiter:
+    """
+    Caps concurrent graph runs and how many tool calls may wait for a free slot.
+    Queue places are reserved at admission, before anything is awaited, so calls
+    arriving together can't all pass the check; each run gives its place back once
+    it holds a slot.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.max_queue = max_queue
+        self.waiting = 0
+
+    def reserve(self, count: int = 1) -> bool:
+        if self.waiting + count > self.max_queue:
+            return False
+        self.waiting += count
+        return True
+
+    @asynccontextmanager
+    async def slot(self):
+        """Runs one reserved call; its queue place is released whether or not it gets the slot."""
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+limiter = ToolLimiter(settings.MCP_MAX_CONCURRENCY, settings.MCP_MAX_QUEUE)
 
 # Initialize MCP Server
 server = Server("agri-cult-service")
 
+class ProgressReporter:
+    """Sends MCP progress notifications as graph nodes finish, if the client asked for them."""
+
+    def __init__(self, total: int):
+        context = server.request_context
+        self.session = context.session
+        self.token = context.meta.progressToken if context.meta else None
+        self.total = total
+        self.done = 0
+
+    async def advance(self, node: str = None):
+        if node is not None:
+            self.done = min(self.done + 1, self.total)
+        if self.token is None:
+            return
+        try:
+            await self.session.send_progress_notification(
+                progress_token=self.token, progress=self.done, total=self.total
+            )
+        except Exception as e:
+            logger.warning("MCP progress notification failed: %s", e)
+
+    async def finish(self):
+        # Runs that skip web search finish with fewer nodes than budgeted.
+        self.done = self.total
+        await self.advance()
+
+async def run_graph(question: str, session_id: str, progress: ProgressReporter = None) -> dict:
+    """
+    Runs the graph in a worker thread under the concurrency limit, reporting each finished node.
+    The caller must have reserved a queue place with limiter.reserve().
+    """
+    loop = asyncio.get_running_loop()
+    request_id = uuid.uuid4().hex[:16]
+    initial_state = {"question": question, "request_id": request_id, "session_id": session_id}
+    config = {"configurable": {"thread_id": session_id}}
+
+    def run():
+        with recording(question, session_id):
+            for update in app_graph.stream(initial_state, config=config, stream_mode="updates"):
+                if progress is not None:
+                    for node in update:
+                        asyncio.run_coroutine_threadsafe(progress.advance(node), loop)
+        return app_graph.get_state(config).values
+
+    async with limiter.slot():
+        # The deadline starts once a slot is free, not while the call is queued.
+        initial_state["deadline"] = new_deadline()
+        with bind_log_context(request_id=request_id, session_id=session_id):
+            return await asyncio.to_thread(run)
+
+def format_answer(final_state: dict) -> str:
+    answer = final_state.get("answer", "No answer generated.")
+    sources = final_state.get("sources", [])
+    lines = [answer, "", "Sources:"]
+    lines.extend(f"- {s.get('document')} (Page {s.get('page')})" for s in sources)
+    return "\n".join(lines)
+
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
     """List available agricultural tools."""
@@ -29,6 +130,23 @@ async def handle_list_tools() -> list[types.Tool]:
                 },
                 "required": ["question"],
             },
+        ),
+        types.Tool(
+            name="query_agri_expert_batch",
+            description="Ask the expert advisor several independent questions in one call.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "questions": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "maxItems": settings.MCP_BATCH_MAX_QUESTIONS,
+                        "description": "The farmer's questions, answered independently."
+                    },
+                    "session_id": {"type": "string", "description": "Optional session ID prefix for memory context."}
+                },
+                "required": ["questions"],
+            },
         )
     ]
 
@@ -43,32 +161,56 @@ async def handle_call_tool(
         
         question = arguments["question"]
         session_id = arguments.get("session_id", "mcp-default")
+
+        progress = ProgressReporter(NODES_PER_RUN)
+        if not limiter.reserve():
+            return [types.TextContent(type="text", text="Error: Server is busy, please retry shortly.")]
         
         try:
-            logger.info(f"MCP Call: {question}")
-            initial_state = {"question": question}
-            config = {"configurable": {"thread_id": session_id}}
-            
-            # Invoke the graph
-            final_state = await asyncio.to_thread(app_graph.invoke, initial_state, config=config)
-            
-            answer = final_state.get("answer", "No answer generated.")
-            sources = final_state.get("sources", [])
+            logger.info("MCP Call: %s", question)
+            final_state = await run_graph(question, session_id, progress)
+            await progress.finish()
             
-            source_text = "\n\nSources:"
-            for s in sources:
-                source_text += f"\n- {s.get('document')} (Page {s.get('page')})"
-            
-            return [
-                types.TextContent(
-                    type="text",
-                    text=f"{answer}{source_text}"
-                )
-            ]
+            return [types.TextContent(type="text", text=format_answer(final_state))]
         except Exception as e:
-            logger.error(f"MCP Tool Error: {str(e)}")
+            logger.error("MCP Tool Error: %s", e)
             return [types.TextContent(type="text", text=f"Error: {str(e)}")]
 
+    if name == "query_agri_expert_batch":
+        if not arguments or not arguments.get("questions"):
+            raise ValueError("Missing 'questions' argument")
+
+        questions = [q for q in arguments["questions"] if isinstance(q, str) and q.strip()]
+        if len(questions) > settings.MCP_BATCH_MAX_QUESTIONS:
+            raise ValueError(f"At most {settings.MCP_BATCH_MAX_QUESTIONS} questions per batch")
+        session_id = arguments.get("session_id", "mcp-default")
+
+        progress = ProgressReporter(NODES_PER_RUN * len(questions))
+        if not limiter.reserve(len(questions)):
+            return [types.TextContent(type="text", text="Error: Server is busy, please retry shortly.")]
+
+        logger.info("MCP Batch Call: %d questions", len(questions))
+
+        # Embed every question in one forward pass; the retriever then hits the query cache.
+        try:
+            await asyncio.to_thread(get_embeddings().prime, questions)
+        except Exception as e:
+            logger.warning("MCP batch embedding failed, falling back to per-question embedding: %s", e)
+
+        async def answer(index: int, question: str) -> types.TextContent:
+            try:
+                # Separate threads so concurrent runs don't interleave conversation history.
+                final_state = await run_graph(question, f"{session_id}:batch-{index}", progress)
+                text = format_answer(final_state)
+            except Exception as e:
+                logger.error("MCP Batch Tool Error: %s", e)
+                text = f"Error: {str(e)}"
+            return types.TextContent(type="text", text=f"Q{index + 1}: {question}\n\n{text}")
+
+        results = await asyncio.gather(*(answer(i, q) for i, q in enumerate(questions)))
+        await progress.finish()
+        return list(results)
+
     raise ValueError(f"Unknown tool: {name}")
 
 async def main():
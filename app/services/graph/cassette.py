@@ -0,0 +1,231 @@
+"""
+Record-and-replay cassettes for graph runs.
+
+With CASSETTE_RECORD enabled every app_graph run is captured: the question, the
+intent, retrieved chunk IDs and scores, LLM prompts and responses and Tavily
+results. Runs are appended as gzip-compressed JSON lines to a per-process file
+that rotates by size. Replay feeds those recordings back through the same call
+sites so the graph can be re-executed offline (see scripts/replay_cassettes.py).
+"""
+
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from app.core.config import settings, get_logger
+
+logger = get_logger("graph")
+
+CASSETTE_VERSION = 1
+
+class CassetteMiss(LookupError):
+    """Replay reached an upstream call that the recording doesn't contain."""
+
+class Tape:
+    """Upstream calls of one graph run, either being recorded or played back."""
+
+    def __init__(self, replaying: bool = False, events: List[Dict[str, Any]] = None, realtime: bool = False):
+        self.replaying = replaying
+        self.realtime = realtime
+        self.events: List[Dict[str, Any]] = list(events or [])
+        self.used = [False] * len(self.events)
+        # Calls seen during replay, kept for reports (e.g. prompt tokens of new prompts)
+        self.observed: List[Dict[str, Any]] = []
+        # (start, end) offsets in ms of replayed upstream waits
+        self.waits: List[tuple] = []
+        self.closed = False
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, key: Any, result: Any, latency_ms: float, details: Dict[str, Any] = None, error: str = None):
+        started_ms = (time.perf_counter() - self.started) * 1000 - latency_ms
+        event = {"kind": kind, "key": key, "started_ms": round(started_ms, 1), "latency_ms": round(latency_ms, 1)}
+        if details:
+            event["details"] = details
+        if error is not None:
+            event["error"] = error
+        else:
+            event["result"] = result
+        with self._lock:
+            if not self.closed:
+                self.events.append(event)
+
+    def replay(self, kind: str, key: Any, details: Dict[str, Any] = None) -> Any:
+        # Match on kind and key rather than position; background calls can finish in any order.
+        with self._lock:
+            self.observed.append({"kind": kind, "key": key, "details": details or {}})
+            for i, event in enumerate(self.events):
+                if not self.used[i] and event["kind"] == kind and event["key"] == key:
+                    self.used[i] = True
+                    break
+            else:
+                raise CassetteMiss(f"No recorded '{kind}' call for {key!r}")
+
+        if self.realtime:
+            start = (time.perf_counter() - self.started) * 1000
+            time.sleep(event["latency_ms"] / 1000)
+            with self._lock:
+                self.waits.append((start, start + event["latency_ms"]))
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        return event["result"]
+
+def upstream_ms(intervals: List[tuple]) -> float:
+    """
+    Wall time covered by at least one upstream call. Speculative and prefetch calls
+    overlap the critical path, so summing their latencies would overcount.
+    """
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+def recorded_upstream_ms(run: Dict[str, Any]) -> Optional[float]:
+    """Upstream wall time of a recorded run, or None for cassettes without call start times."""
+    events = run.get("events", [])
+    if any("started_ms" not in event for event in events):
+        return None
+    return upstream_ms([(e["started_ms"], e["started_ms"] + e["latency_ms"]) for e in events])
+
+_active_tape: ContextVar[Optional[Tape]] = ContextVar("cassette_tape", default=None)
+
+def replaying() -> bool:
+    tape = _active_tape.get()
+    return tape is not None and tape.replaying
+
+def taped(kind: str, key: Any, fn: Callable, *args, details: Dict[str, Any] = None,
+          encode: Callable = None, decode: Callable = None, **kwargs) -> Any:
+    """
+    Runs an upstream call through the active cassette.
+    Without a cassette this is just fn(*args, **kwargs). Results are stored as JSON, so
+    `encode` turns a result into plain data and `decode` rebuilds it on replay.
+    """
+    tape = _active_tape.get()
+    if tape is None:
+        return fn(*args, **kwargs)
+    if tape.replaying:
+        value = tape.replay(kind, key, details)
+        return decode(value) if decode else value
+
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        tape.record(kind, key, None, (time.perf_counter() - start) * 1000, details, error=str(e))
+        raise
+    tape.record(kind, key, encode(result) if encode else result, (time.perf_counter() - start) * 1000, details)
+    return result
+
+class CassetteWriter:
+    """Appends runs as gzip members to a per-process file and rotates it by size."""
+
+    def __init__(self, directory: str = None, max_bytes: int = None, backups: int = None):
+        self.directory = directory or settings.CASSETTE_DIR
+        self.max_bytes = max_bytes or settings.CASSETTE_MAX_BYTES
+        self.backups = backups if backups is not None else settings.CASSETTE_BACKUPS
+        self.path = os.path.join(self.directory, f"runs-{os.getpid()}.jsonl.gz")
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def write(self, run: Dict[str, Any]):
+        line = json.dumps(run, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+
+_writer: Optional[CassetteWriter] = None
+_writer_lock = threading.Lock()
+# Runs are compressed and written here, never on the caller's (possibly event loop) thread
+_write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cassette-writer")
+
+def _get_writer() -> CassetteWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CassetteWriter()
+        return _writer
+
+@contextmanager
+def recording(question: str, session_id: str = None) -> Iterator[Optional[Tape]]:
+    """Captures the graph run inside the block when CASSETTE_RECORD is enabled."""
+    if not settings.CASSETTE_RECORD or _active_tape.get() is not None:
+        yield None
+        return
+
+    tape = Tape()
+    token = _active_tape.set(tape)
+    start = time.perf_counter()
+    try:
+        yield tape
+    finally:
+        _active_tape.reset(token)
+        with tape._lock:
+            tape.closed = True
+        intent = next((e.get("result") for e in tape.events if e["kind"] == "classify"), None)
+        run = {
+            "version": CASSETTE_VERSION,
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "question": question,
+            "session_id": session_id,
+            "intent": intent,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "events": tape.events,
+        }
+        _write_pool.submit(_write_run, run)
+
+def _write_run(run: Dict[str, Any]):
+    try:
+        _get_writer().write(run)
+    except Exception as e:
+        logger.error("Cassette write failed: %s", e)
+
+def flush_writes():
+    """Waits for queued cassette writes to reach disk."""
+    _write_pool.submit(lambda: None).result()
+
+@contextmanager
+def playback(run: Dict[str, Any], realtime: bool = False) -> Iterator[Tape]:
+    """Serves the upstream calls inside the block from a recorded run."""
+    tape = Tape(replaying=True, events=run.get("events", []), realtime=realtime)
+    token = _active_tape.set(tape)
+    try:
+        yield tape
+    finally:
+        _active_tape.reset(token)
+
+def load_runs(paths: List[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yields recorded runs, oldest files first. Defaults to every cassette in CASSETTE_DIR."""
+    if not paths:
+        paths = glob.glob(os.path.join(settings.CASSETTE_DIR, "runs-*.jsonl.gz*"))
+        paths.sort(key=os.path.getmtime)
+    for path in paths:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -1,14 +1,26 @@
-from app.core.config import settings, logger
-from typing import List, Dict, Any, TypedDict
+from app.core.config import settings, get_logger, bind_log_context
+from app.core.metrics import metrics
+from app.core.resilience import call_upstream, get_breaker
+from typing import List, Dict, Any, Optional, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import threading
+import time
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.sqlite import SqliteSaver
 from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from app.services.llm.classifier import get_intent_classifier
-from app.services.retrieval.retriever import PineconeRetriever
+from app.services.llm.router import RouteRule, fallback_route, select_route
+from app.services.retrieval.retriever import get_retriever
+from app.services.retrieval.chunk_store import get_chunk_store, prompt_text
+from app.services.graph import cassette
 from pydantic import BaseModel, Field
 from langchain_community.tools.tavily_search import TavilySearchResults
 
+logger = get_logger("graph")
+
 # Grader Schema
 class ContextGrader(BaseModel):
     """Binary score for context sufficiency."""
@@ -25,57 +37,256 @@ class GraphState(TypedDict):
     sources: List[Dict[str, Any]]
     search_triggered: bool
     is_satisfied: bool
+    speculative_results: Optional[Dict[str, Any]]
+    prefetched_search: Optional[List[Dict[str, Any]]]
+    request_id: Optional[str]
+    session_id: Optional[str]
+    deadline: Optional[float]
+
+def with_log_context(node):
+    """Binds the run's correlation IDs from the state around a node, whichever thread runs it."""
+    @functools.wraps(node)
+    def wrapper(state: GraphState):
+        with bind_log_context(request_id=state.get("request_id"), session_id=state.get("session_id")):
+            return node(state)
+    return wrapper
+
+# Knowledge base tags searched (and how deep) for each intent. Results of all tags are
+# merged by score and the deepest k kept, so hybrid questions get the best 4 chunks from
+# disease, scheme and learned hybrid knowledge (web results and /feedback corrections).
+RETRIEVAL_PLAN = {
+    "disease": {"disease": 3},
+    "scheme": {"scheme": 3},
+    "hybrid": {"disease": 4, "scheme": 4, "hybrid": 4},
+    "out_of_scope": {},
+}
+
+# Knowledge bases searched speculatively while the intent is being classified
+SPECULATIVE_TAGS = ("disease", "scheme")
+
+def merge_by_score(results_by_tag: Dict[str, List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """Best top_k results across tags; a single tag keeps its own order."""
+    results = [res for tag_results in results_by_tag.values() for res in tag_results]
+    if len(results_by_tag) > 1:
+        results.sort(key=lambda res: res.get("score") or 0.0, reverse=True)
+    return results[:top_k]
+
+# Shared pool for work that runs alongside the critical path
+_background_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="graph-bg")
+
+def submit_background(fn, *args, **kwargs):
+    """Runs fn on the background pool, carrying over the caller's context variables."""
+    context = contextvars.copy_context()
+    return _background_pool.submit(context.run, fn, *args, **kwargs)
+
+class SearchBudget:
+    """
+    Quota for speculative web searches.
+    Every request earns a fraction of a search; a speculative search spends a whole one.
+    """
+
+    def __init__(self, earn_per_request: float, max_balance: float):
+        self.earn_per_request = earn_per_request
+        self.max_balance = max_balance
+        self.balance = max_balance
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.balance = min(self.max_balance, self.balance + self.earn_per_request)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+search_budget = SearchBudget(settings.SPECULATIVE_SEARCH_BUDGET_PER_REQUEST, settings.SPECULATIVE_SEARCH_MAX_BALANCE)
+
+# Upstream calls. Each goes through the cassette so graph runs can be recorded and replayed offline,
+# and through call_upstream for timeouts from the request deadline, hedging and circuit breaking.
+def _llm_dependency(model: str) -> str:
+    return "groq" if model == settings.GROQ_MODEL else "groq_fast"
+
+def _web_search(question: str, deadline: float = None) -> List[Dict[str, Any]]:
+    search = lambda: call_upstream("tavily", TavilySearchResults(max_results=2).invoke, question, deadline=deadline)
+    return cassette.taped("search", None, search)
+
+def _encode_results(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Chunk text is rebuilt from the local chunk store on replay; only inline (legacy) text is kept.
+    encoded = []
+    for res in results:
+        metadata = res.get("metadata") or {}
+        item = {"id": res.get("id"), "score": res.get("score"), "metadata": metadata}
+        if not metadata.get("chunk_id"):
+            item["content"] = res.get("content", "")
+        encoded.append(item)
+    return encoded
+
+def _decode_results(encoded: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    chunks = get_chunk_store().get_many([item["id"] for item in encoded if "content" not in item])
+    return [
+        {**item, "content": item["content"] if "content" in item else (prompt_text(chunks[item["id"]]) if item["id"] in chunks else "")}
+        for item in encoded
+    ]
+
+def _retrieve(question: str, tag: str, top_k: int, deadline: float = None) -> List[Dict[str, Any]]:
+    return cassette.taped(
+        "retrieve", [tag, top_k],
+        lambda: get_retriever().retrieve(question, container_tag=tag, top_k=top_k, deadline=deadline),
+        encode=_encode_results, decode=_decode_results
+    )
+
+def _grade(prompt: str, deadline: float = None) -> ContextGrader:
+    grader_llm = ChatGroq(model=settings.GROQ_FAST_MODEL, temperature=0).with_structured_output(ContextGrader)
+    invoke_grader = lambda: call_upstream("groq_fast", grader_llm.invoke, prompt, deadline=deadline)
+    return cassette.taped(
+        "grade", None, invoke_grader, details={"prompt": prompt},
+        encode=lambda grade: grade.model_dump(), decode=lambda data: ContextGrader(**data)
+    )
+
+def _generate(model: str, messages: List[Any], deadline: float = None) -> AIMessage:
+    llm = ChatGroq(model=model, temperature=0.2)
+    return cassette.taped(
+        "generate", None, lambda: call_upstream(_llm_dependency(model), llm.invoke, messages, deadline=deadline),
+        details={"model": model, "messages": [{"role": m.type, "content": m.content} for m in messages]},
+        encode=lambda response: {"content": response.content, "usage": response.usage_metadata},
+        decode=lambda data: AIMessage(content=data["content"], usage_metadata=data.get("usage"))
+    )
+
+def format_source(content: str, metadata: Dict[str, Any]) -> str:
+    """One retrieved chunk as it appears in the generation context."""
+    doc = metadata.get("document_name", "Unknown")
+    pg = metadata.get("page_number", "N/A")
+    return f"\n--- SOURCE: {doc} (Page {pg}) ---\n{content}\n"
+
+def _is_borderline(results: List[Dict[str, Any]]) -> bool:
+    """True when the best match is neither clearly relevant nor clearly off-topic."""
+    scores = [r["score"] for r in results if r.get("score") is not None]
+    if not scores:
+        return False
+    return settings.SPECULATIVE_SEARCH_MIN_SCORE <= max(scores) <= settings.SPECULATIVE_SEARCH_MAX_SCORE
+
+def _classify(question: str, deadline: float = None) -> str:
+    classify = lambda: call_upstream("groq_fast", get_intent_classifier().invoke, {"query": question}, deadline=deadline).intent
+    try:
+        return cassette.taped("classify", None, classify)
+    except Exception as e:
+        logger.error("Classification error: %s", e)
+        return "hybrid" # Fallback to hybrid for safety
+
+def _timed_web_search(question: str, deadline: float = None):
+    start = time.perf_counter()
+    results = _web_search(question, deadline)
+    return results, (time.perf_counter() - start) * 1000
+
+def _timed_retrieve(question: str, tag: str, top_k: int, deadline: float = None):
+    start = time.perf_counter()
+    results = _retrieve(question, tag, top_k, deadline)
+    return results, (time.perf_counter() - start) * 1000
 
 # Nodes
 def classify_intent_node(state: GraphState):
     logger.info("Classifying user intent")
     question = state["question"]
-    classifier = get_intent_classifier()
-    
-    try:
-        result = classifier.invoke({"query": question})
-        intent = result.intent
-    except Exception as e:
-        logger.error(f"Classification error: {e}")
-        intent = "hybrid" # Fallback to hybrid for safety
-        
-    return {"intent": intent}
+    deadline = state.get("deadline")
+
+    if not settings.SPECULATIVE_RETRIEVAL:
+        return {"intent": _classify(question, deadline), "speculative_results": None}
+
+    # Speculative mode: search every knowledge base while the classifier is still thinking.
+    start = time.perf_counter()
+    top_k = max(k for plan in RETRIEVAL_PLAN.values() for k in plan.values())
+    futures = {tag: submit_background(_timed_retrieve, question, tag, top_k, deadline) for tag in SPECULATIVE_TAGS}
+
+    classify_start = time.perf_counter()
+    intent = _classify(question, deadline)
+    classify_ms = (time.perf_counter() - classify_start) * 1000
+
+    plan = RETRIEVAL_PLAN.get(intent, RETRIEVAL_PLAN["hybrid"])
+    speculative = {"question": question}
+    retrieve_ms = [0.0]
+    for tag, k in plan.items():
+        if tag not in futures:
+            continue
+        try:
+            results, tag_ms = futures[tag].result()
+        except Exception as e:
+            logger.error("Speculative retrieval error: %s", e)
+            results, tag_ms = [], 0.0
+        speculative[tag] = results[:k]
+        retrieve_ms.append(tag_ms)
+    # Without speculation the needed tags would run in parallel after classification
+    serial_ms = classify_ms + max(retrieve_ms)
+
+    # Unused searches are cancelled if they haven't started; running ones finish and are dropped.
+    unused = [future for tag, future in futures.items() if tag not in plan]
+    for future in unused:
+        if future.cancel():
+            metrics.incr("speculative_retrieval.cancelled_searches")
+    wasted = len(unused)
+    critical_ms = (time.perf_counter() - start) * 1000
+    metrics.incr("speculative_retrieval.runs")
+    metrics.incr("speculative_retrieval.wasted_searches", wasted)
+    metrics.observe("speculative_retrieval.saved_ms", serial_ms - critical_ms)
+    logger.info("Speculative retrieval for %s: saved %.0fms, wasted %d searches", intent, serial_ms - critical_ms, wasted)
+
+    return {"intent": intent, "speculative_results": speculative}
 
 def retrieve_node(state: GraphState):
     intent = state["intent"]
+    if settings.SPECULATIVE_SEARCH:
+        search_budget.earn()
     
     if intent == "out_of_scope":
-        return {"context": "NOT_APPLICABLE", "sources": [], "search_triggered": False}
+        return {"context": "NOT_APPLICABLE", "sources": [], "search_triggered": False, "prefetched_search": None}
         
-    logger.info(f"Retrieving from Pinecone for {intent.upper()}")
+    logger.info("Retrieving from Pinecone for %s", intent.upper())
     question = state["question"]
-    retriever = PineconeRetriever()
+    deadline = state.get("deadline")
     
     context = ""
     sources = []
     
-    if intent == "hybrid":
-        disease_results = retriever.retrieve(question, container_tag="disease", top_k=2)
-        scheme_results = retriever.retrieve(question, container_tag="scheme", top_k=2)
-        results = disease_results + scheme_results
+    plan = RETRIEVAL_PLAN.get(intent, RETRIEVAL_PLAN["hybrid"])
+    speculative = state.get("speculative_results")
+    to_fetch = {
+        tag: k for tag, k in plan.items()
+        if not (speculative and speculative.get("question") == question and tag in speculative)
+    }
+    # Several knowledge bases (hybrid) are searched in parallel; a single one runs inline
+    if len(to_fetch) > 1:
+        pending = {tag: submit_background(_retrieve, question, tag, k, deadline) for tag, k in to_fetch.items()}
+        fetched = {tag: future.result() for tag, future in pending.items()}
     else:
-        results = retriever.retrieve(question, container_tag=intent, top_k=3)
+        fetched = {tag: _retrieve(question, tag, k, deadline) for tag, k in to_fetch.items()}
+    results = merge_by_score({tag: fetched[tag] if tag in fetched else speculative[tag] for tag in plan}, max(plan.values()))
+    # Only results that reach the context count as usage of learned chunks
+    if not cassette.replaying():
+        get_retriever().record_usage(results)
         
     for res in results:
-        content = res.get("content", "")
         metadata = res.get("metadata") or {}
-        doc = metadata.get("document_name", "Unknown")
-        pg = metadata.get("page_number", "N/A")
-        
-        context += f"\n--- SOURCE: {doc} (Page {pg}) ---\n{content}\n"
-        sources.append({"document": doc, "page": pg})
+        context += format_source(res.get("content", ""), metadata)
+        sources.append({"document": metadata.get("document_name", "Unknown"), "page": metadata.get("page_number", "N/A")})
         
     # Intelligent LLM Grader to avoid over-searching
     search_triggered = False
+    prefetched_search = None
     if results and len(context) > 100:
+        # Borderline matches often fail grading, so start the web search alongside the grader.
+        prefetch = None
+        if settings.SPECULATIVE_SEARCH and _is_borderline(results) and get_breaker("tavily").available():
+            if search_budget.try_spend():
+                prefetch = submit_background(_timed_web_search, question, deadline)
+                metrics.incr("speculative_search.started")
+            else:
+                metrics.incr("speculative_search.over_budget")
+
         logger.info("Grading context sufficiency")
+        grade_start = time.perf_counter()
         try:
-            grader_llm = ChatGroq(model="llama-3.1-8b-instant", temperature=0).with_structured_output(ContextGrader)
             grade_prompt = f"""You are a quality grader. Given a user question and the retrieved context, decide if the context matches the question well enough to provide a helpful answer WITHOUT searching the web.
             
             Question: {question}
@@ -83,18 +294,32 @@ def retrieve_node(state: GraphState):
             
             Is the context sufficient?"""
             
-            grade = grader_llm.invoke(grade_prompt)
+            grade = _grade(grade_prompt, deadline)
             if not grade.is_sufficient:
-                logger.info(f"Context insufficient: {grade.reason}. Triggering search")
+                logger.info("Context insufficient: %s. Triggering search", grade.reason)
                 search_triggered = True
         except Exception as e:
-            logger.warning(f"Grader error: {e}. Falling back to no search")
+            logger.warning("Grader error: %s. Falling back to no search", e)
             search_triggered = False # Safe fallback: don't search if grader fails
+
+        if prefetch is not None:
+            if search_triggered:
+                grade_ms = (time.perf_counter() - grade_start) * 1000
+                try:
+                    prefetched_search, search_ms = prefetch.result()
+                    metrics.incr("speculative_search.hits")
+                    # Overlap with the grader is the saving; a search slower than the grader is still partly waited for
+                    metrics.observe("speculative_search.saved_ms", min(search_ms, grade_ms))
+                except Exception as e:
+                    logger.warning("Speculative search error: %s. Searching again", e)
+            else:
+                prefetch.cancel()
+                metrics.incr("speculative_search.wasted")
     else:
         logger.info("No info in Pinecone. Triggering search")
         search_triggered = True
         
-    return {"context": context, "sources": sources, "search_triggered": search_triggered}
+    return {"context": context, "sources": sources, "search_triggered": search_triggered, "prefetched_search": prefetched_search}
 
 def web_search_node(state: GraphState):
     logger.info("Web searching for new knowledge")
@@ -102,11 +327,12 @@ def web_search_node(state: GraphState):
     intent = state["intent"]
     
     try:
-        search = TavilySearchResults(max_results=2)
-        search_results = search.invoke(question)
-        logger.info(f"Search found {len(search_results)} results")
+        search_results = state.get("prefetched_search")
+        if search_results is None:
+            search_results = _web_search(question, state.get("deadline"))
+        logger.info("Search found %d results", len(search_results))
     except Exception as e:
-        logger.error(f"Search error: {e}")
+        logger.error("Search error: %s", e)
         return {"context": state["context"] + "\n[Web search failed]", "sources": state["sources"]}
     
     new_context = state["context"] + "\n\n--- ADDITIONAL WEB KNOWLEDGE ---\n"
@@ -120,52 +346,27 @@ def web_search_node(state: GraphState):
         new_sources.append({"document": f"Web: {url}", "page": "N/A"})
         learned_content += f"{content} "
 
-    # Self-Learning: Store this back to Pinecone!
-    if learned_content.strip() and search_results:
+    # Self-Learning: Store this back to Pinecone! (never while replaying a cassette)
+    if learned_content.strip() and search_results and not cassette.replaying():
         try:
-            retriever = PineconeRetriever()
+            retriever = get_retriever()
             retriever.add_learned_knowledge(learned_content, search_results[0].get("url", "Link"), intent)
         except Exception as e:
-            logger.error(f"Learning error: {e}")
+            logger.error("Learning error: %s", e)
     
     return {"context": new_context, "sources": new_sources}
 
-def generate_answer_node(state: GraphState):
-    logger.info("Generating final answer")
-    question = state["question"]
-    context = state["context"]
-    intent = state["intent"]
-    history = state.get("history", [])
-    search_triggered = state.get("search_triggered", False)
-    
-    llm = ChatGroq(model=settings.GROQ_MODEL, temperature=0.2)
-    
-    if intent == "out_of_scope":
-        prompt = """You are a warm and helpful agricultural expert. The user has asked something outside your core expertise.
+# Static system prompts stay byte-identical across requests so upstream prompt caching can reuse them.
+OUT_OF_SCOPE_PROMPT = """You are a warm and helpful agricultural expert. The user has asked something outside your core expertise.
         
         Response Rules:
         1. Acknowledge the question kindly.
         2. Gently steer them back to agricultural topics (citrus diseases or government schemes) where you can provide real value.
         3. Do not be a rigid robot; sound like a friendly neighbor who also happens to be a scientist.
         """
-    else:
-        history_str = ""
-        if history:
-            history_str = "\n--- RECENT CONVERSATION ---\n"
-            for msg in history[-2:]: 
-                role = "Farmer" if isinstance(msg, HumanMessage) else "Advisor"
-                history_str += f"{role}: {msg.content[:300]}\n"
-
-        if len(context) > 4000:
-            context = context[:4000] + "\n... [Context trimmed for focus] ..."
-
-        learning_note = "I've included some fresh insights from my research to ensure you have the most complete answer." if search_triggered else ""
 
-        prompt = f"""You are the Elite Agri-Cult Consultant. Your signature answers are the gold standard for agricultural advice.
-        
-        KNOWLEDGE BASE CONTEXT: {context}
-        {history_str}
-        QUESTION: {question}
+CONSULTANT_PROMPT = """You are the Elite Agri-Cult Consultant. Your signature answers are the gold standard for agricultural advice.
+        The farmer's message contains the KNOWLEDGE BASE CONTEXT, any recent conversation and their QUESTION.
         
         SIGNATURE ANSWER FORMAT (MANDATORY):
         1. **EXPERT ANALYSIS**: Start with a warm professional greeting. Summarize the core answer clearly. If the data is complex or in a table, DE-CLUTTER it and present only the most important facts in simple bullet points.
@@ -179,17 +380,69 @@ def generate_answer_node(state: GraphState):
         - Bold the headers (**EXPERT ANALYSIS**, etc.).
         - Fix all raw data: Convert any messy text or table data into clear, human-readable sentences.
         """
+
+DEGRADED_ANSWER = "I'm having trouble reaching my knowledge services right now. Please try again in a moment."
+
+def _record_generation(route: RouteRule, model: str, latency_ms: float, response):
+    usage = getattr(response, "usage_metadata", None) or {}
+    metrics.incr(f"generation.{route.name}.requests")
+    metrics.observe(f"generation.{route.name}.latency_ms", latency_ms)
+    metrics.incr(f"generation.{route.name}.input_tokens", usage.get("input_tokens", 0))
+    metrics.incr(f"generation.{route.name}.output_tokens", usage.get("output_tokens", 0))
+
+    if model != settings.GROQ_MODEL:
+        # Savings are measured against the default route's recent median latency.
+        metrics.incr("generation.default_model_tokens_avoided", usage.get("total_tokens", 0))
+        default_p50 = metrics.percentile("generation.default.latency_ms", 50)
+        if default_p50 is not None:
+            metrics.observe(f"generation.{route.name}.saved_ms", default_p50 - latency_ms)
+
+def generate_answer_node(state: GraphState):
+    logger.info("Generating final answer")
+    question = state["question"]
+    context = state["context"]
+    intent = state["intent"]
+    history = state.get("history", [])
     
-    messages = [SystemMessage(content=prompt), HumanMessage(content=question)]
+    if intent == "out_of_scope":
+        messages = [SystemMessage(content=OUT_OF_SCOPE_PROMPT), HumanMessage(content=question)]
+    else:
+        history_str = ""
+        if history:
+            history_str = "\n--- RECENT CONVERSATION ---\n"
+            for msg in history[-2:]: 
+                role = "Farmer" if isinstance(msg, HumanMessage) else "Advisor"
+                history_str += f"{role}: {msg.content[:300]}\n"
+
+        if len(context) > 4000:
+            context = context[:4000] + "\n... [Context trimmed for focus] ..."
+
+        user_prompt = f"""KNOWLEDGE BASE CONTEXT: {context}
+        {history_str}
+        QUESTION: {question}"""
+        messages = [SystemMessage(content=CONSULTANT_PROMPT), HumanMessage(content=user_prompt)]
+
+    route = select_route(intent, context, question)
+    fallback_model = settings.GROQ_FAST_MODEL if route.model != settings.GROQ_FAST_MODEL else settings.GROQ_MODEL
     
-    try:
-        response = llm.invoke(messages)
-        answer = response.content
-    except Exception as e:
-        logger.error(f"Generation error: {e}")
-        llm_fallback = ChatGroq(model="llama-3.1-8b-instant", temperature=0.2)
-        response = llm_fallback.invoke(messages)
-        answer = response.content
+    deadline = state.get("deadline")
+    response = None
+    # An open breaker raises immediately, so an unhealthy 70B model falls through to the 8B one.
+    for model in (route.model, fallback_model):
+        start = time.perf_counter()
+        try:
+            response = _generate(model, messages, deadline)
+        except Exception as e:
+            logger.error("%s error: %s", "Generation" if model == route.model else "Fallback generation", e)
+            continue
+        # Only the call that answered is recorded, under the model that produced it
+        answered_by = route if model == route.model else fallback_route(model)
+        _record_generation(answered_by, model, (time.perf_counter() - start) * 1000, response)
+        break
+    if response is None:
+        metrics.incr("generation.degraded")
+        response = AIMessage(content=DEGRADED_ANSWER)
+    answer = response.content
     
     # Update history
     new_history = history + [HumanMessage(content=question), response]
@@ -199,16 +452,19 @@ def generate_answer_node(state: GraphState):
 # Routing logic
 def decide_to_search(state: GraphState):
     if state["search_triggered"]:
+        if not get_breaker("tavily").available():
+            logger.warning("Web search unavailable (circuit open). Answering from retrieved context")
+            return "generate"
         return "search"
     return "generate"
 
 # Build the graph
 workflow = StateGraph(GraphState)
 
-workflow.add_node("classify", classify_intent_node)
-workflow.add_node("retrieve", retrieve_node)
-workflow.add_node("search", web_search_node)
-workflow.add_node("generate", generate_answer_node)
+workflow.add_node("classify", with_log_context(classify_intent_node))
+workflow.add_node("retrieve", with_log_context(retrieve_node))
+workflow.add_node("search", with_log_context(web_search_node))
+workflow.add_node("generate", with_log_context(generate_answer_node))
 
 workflow.set_entry_point("classify")
 workflow.add_edge("classify", "retrieve")
@@ -42,6 +42,6 @@ if __name__ == "__main__":
     classifier = get_intent_classifier()
     test_query = "What schemes can help me manage Citrus Canker?"
     result = classifier.invoke({"query": test_query})
-    logger.info(f"Query: {test_query}")
-    logger.info(f"Intent: {result.intent}")
-    logger.info(f"Explanation: {result.explanation}")
+    logger.info("Query: %s", test_query)
+    logger.info("Intent: %s", result.intent)
+    logger.info("Explanation: %s", result.explanation)
@@ -0,0 +1,73 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from app.core.config import settings, logger
+
+class RouteRule(BaseModel):
+    """One row of the generation routing policy. Unset limits always match."""
+    name: str
+    model: str
+    intents: Optional[List[str]] = Field(None, description="Intents this route applies to.")
+    max_context_chars: Optional[int] = Field(None, description="Largest packed context this route accepts.")
+    max_complexity: Optional[int] = Field(None, description="Highest question complexity score this route accepts.")
+
+    def matches(self, intent: str, context_chars: int, complexity: int) -> bool:
+        if self.intents is not None and intent not in self.intents:
+            return False
+        if self.max_context_chars is not None and context_chars > self.max_context_chars:
+            return False
+        if self.max_complexity is not None and complexity > self.max_complexity:
+            return False
+        return True
+
+# A single-intent retrieval packs 3 chunks of up to 1000 chars (scripts/ingest_documents.py)
+# plus their SOURCE headers. Anything larger has picked up web results or extra history.
+SINGLE_INTENT_CONTEXT_CHARS = 3 * (1000 + 100)
+
+# Rules are checked in order; anything unmatched goes to settings.GROQ_MODEL.
+DEFAULT_POLICY = [
+    {"name": "out_of_scope", "model": settings.GROQ_FAST_MODEL, "intents": ["out_of_scope"]},
+    {"name": "simple", "model": settings.GROQ_FAST_MODEL, "intents": ["disease", "scheme"], "max_context_chars": SINGLE_INTENT_CONTEXT_CHARS, "max_complexity": 2},
+]
+
+# Words that usually mean the farmer wants several facts at once
+COMPLEXITY_MARKERS = {"and", "or", "both", "which", "also"}
+# Comparison and explanation questions are never single-fact ones
+REASONING_MARKERS = {"compare", "difference", "versus", "vs", "why", "explain"}
+REASONING_POINTS = 3
+
+def question_complexity(question: str) -> int:
+    """
+    Rough score: one point per 10 words, per conjunction marker and per extra question,
+    and REASONING_POINTS per reasoning marker, so one is enough to rule out the fast route.
+    """
+    words = [w.strip("?,.!;:").lower() for w in question.split()]
+    markers = sum(1 for w in words if w in COMPLEXITY_MARKERS)
+    reasoning = sum(REASONING_POINTS for w in words if w in REASONING_MARKERS)
+    extra_questions = max(0, question.count("?") - 1)
+    return len(words) // 10 + markers + reasoning + extra_questions
+
+def load_policy() -> List[RouteRule]:
+    rules = settings.GENERATION_ROUTING_POLICY or DEFAULT_POLICY
+    return [RouteRule(**rule) for rule in rules]
+
+# Parsed once, so a malformed GENERATION_ROUTING_POLICY fails at startup instead of on every request
+ROUTING_POLICY = load_policy()
+
+def default_route() -> RouteRule:
+    return RouteRule(name="default", model=settings.GROQ_MODEL)
+
+def fallback_route(model: str) -> RouteRule:
+    """Route that metrics are recorded under when the fallback model answered."""
+    return default_route() if model == settings.GROQ_MODEL else RouteRule(name="fallback", model=model)
+
+def select_route(intent: str, context: str, question: str, policy: List[RouteRule] = None) -> RouteRule:
+    """Picks the generation model for a request from the routing policy."""
+    if not settings.GENERATION_ROUTING:
+        return default_route()
+
+    complexity = question_complexity(question)
+    for rule in policy if policy is not None else ROUTING_POLICY:
+        if rule.matches(intent, len(context), complexity):
+            logger.info("Routing generation to %s via '%s' (complexity=%d, context=%d chars)", rule.model, rule.name, complexity, len(context))
+            return rule
+    return default_route()
@@ -0,0 +1,236 @@
+"""
+Local chunk store.
+
+Chunk text, page and document live in SQLite (in the ./db volume) keyed by a stable
+chunk ID. The vector index only keeps the ID and the fields we filter on, and
+retrieval results are rebuilt from here with batched lookups and a hot-chunk LRU.
+Learned chunks also get a usage row (created, last used, hits) that drives their
+eviction (see scripts/compact_learned.py).
+"""
+
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Iterable
+from app.core.config import settings, logger
+
+# SQLite's default limit on bound parameters is 999
+LOOKUP_BATCH_SIZE = 500
+
+CHUNK_FIELDS = ("chunk_id", "document_name", "page_number", "knowledge_base_type", "content", "source_url", "is_learned", "condensed")
+
+def make_chunk_id(document_name: str, page_number: Any, ordinal: int) -> str:
+    """Stable ID for the n-th chunk on a page, so re-chunking keeps the vector's key."""
+    return hashlib.sha1(f"{document_name}:{page_number}:{ordinal}".encode("utf-8")).hexdigest()
+
+def make_learned_chunk_id(source_url: str, content: str) -> str:
+    return hashlib.sha1(f"learned:{source_url}:{content}".encode("utf-8")).hexdigest()
+
+def prompt_text(chunk: Dict[str, Any]) -> str:
+    """Text that goes into prompts: the ingest-time condensed form when there is one."""
+    if settings.CONDENSED_CONTEXT and chunk.get("condensed"):
+        return chunk["condensed"]
+    return chunk["content"]
+
+class ChunkStore:
+    def __init__(self, path: str = None, cache_size: int = None):
+        self.path = path or settings.CHUNK_STORE_PATH
+        self.cache_size = cache_size if cache_size is not None else settings.CHUNK_CACHE_SIZE
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # Retrieval hits are buffered and written in one batch every LEARNED_HIT_FLUSH_SECONDS
+        self._hits: Counter = Counter()
+        self._last_used: Dict[str, float] = {}
+        self._hits_lock = threading.Lock()
+        self._last_flush = time.time()
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    document_name TEXT,
+                    page_number,
+                    knowledge_base_type TEXT,
+                    content TEXT NOT NULL,
+                    source_url TEXT,
+                    is_learned INTEGER NOT NULL DEFAULT 0,
+                    condensed TEXT
+                )
+            """)
+            # Stores created before condensation lack the column
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+            if "condensed" not in columns:
+                self._conn.execute("ALTER TABLE chunks ADD COLUMN condensed TEXT")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS learned_usage (
+                    chunk_id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    last_used REAL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS archived_chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    document_name TEXT,
+                    knowledge_base_type TEXT,
+                    content TEXT NOT NULL,
+                    source_url TEXT,
+                    created_at REAL,
+                    last_used REAL,
+                    hits INTEGER,
+                    archived_at REAL NOT NULL,
+                    reason TEXT
+                )
+            """)
+            # Learned chunks from before usage tracking start their clock now
+            self._conn.execute(
+                "INSERT OR IGNORE INTO learned_usage (chunk_id, created_at) SELECT chunk_id, ? FROM chunks WHERE is_learned = 1",
+                (time.time(),)
+            )
+        atexit.register(self.flush_hits)
+
+    def _remember(self, chunk_id: str, chunk: Dict[str, Any]):
+        self._hot[chunk_id] = chunk
+        self._hot.move_to_end(chunk_id)
+        while len(self._hot) > self.cache_size:
+            self._hot.popitem(last=False)
+
+    def put_many(self, chunks: Iterable[Dict[str, Any]]):
+        rows = [tuple(chunk.get(field) for field in CHUNK_FIELDS) for chunk in chunks]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO chunks ({', '.join(CHUNK_FIELDS)}) VALUES ({', '.join('?' * len(CHUNK_FIELDS))})",
+                rows,
+            )
+            # Relearning a chunk restarts its TTL but keeps its hit history
+            self._conn.executemany(
+                "INSERT INTO learned_usage (chunk_id, created_at) VALUES (?, ?) "
+                "ON CONFLICT(chunk_id) DO UPDATE SET created_at = excluded.created_at",
+                [(row[0], time.time()) for row in rows if row[CHUNK_FIELDS.index("is_learned")]],
+            )
+            # Drop stale hot entries for rewritten chunks
+            for row in rows:
+                self._hot.pop(row[0], None)
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns the known chunks for the given IDs; unknown IDs are omitted."""
+        found = {}
+        with self._lock:
+            missing = []
+            for chunk_id in dict.fromkeys(chunk_ids):
+                chunk = self._hot.get(chunk_id)
+                if chunk is not None:
+                    self._hot.move_to_end(chunk_id)
+                    found[chunk_id] = chunk
+                else:
+                    missing.append(chunk_id)
+
+            for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                batch = missing[start:start + LOOKUP_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT * FROM chunks WHERE chunk_id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for row in rows:
+                    chunk = dict(row)
+                    found[chunk["chunk_id"]] = chunk
+                    self._remember(chunk["chunk_id"], chunk)
+        return found
+
+    def delete_many(self, chunk_ids: List[str]):
+        with self._lock, self._conn:
+            for start in range(0, len(chunk_ids), LOOKUP_BATCH_SIZE):
+                batch = chunk_ids[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ', '.join('?' * len(batch))
+                self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+                self._conn.execute(f"DELETE FROM learned_usage WHERE chunk_id IN ({placeholders})", batch)
+            for chunk_id in chunk_ids:
+                self._hot.pop(chunk_id, None)
+
+    def archive_many(self, reasons: Dict[str, str]):
+        """Moves learned chunks and their usage into archived_chunks, then deletes them."""
+        chunk_ids = list(reasons)
+        now = time.time()
+        with self._lock, self._conn:
+            for start in range(0, len(chunk_ids), LOOKUP_BATCH_SIZE):
+                batch = chunk_ids[start:start + LOOKUP_BATCH_SIZE]
+                rows = self._conn.execute(f"""
+                    SELECT c.chunk_id, c.document_name, c.knowledge_base_type, c.content, c.source_url,
+                           u.created_at, u.last_used, u.hits
+                    FROM chunks c LEFT JOIN learned_usage u ON u.chunk_id = c.chunk_id
+                    WHERE c.chunk_id IN ({', '.join('?' * len(batch))})
+                """, batch).fetchall()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO archived_chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(row) + (now, reasons[row["chunk_id"]]) for row in rows],
+                )
+        self.delete_many(chunk_ids)
+
+    def record_hits(self, chunk_ids: Iterable[str]):
+        """Counts retrieval hits on learned chunks; cheap enough for every query."""
+        now = time.time()
+        with self._hits_lock:
+            for chunk_id in chunk_ids:
+                self._hits[chunk_id] += 1
+                self._last_used[chunk_id] = now
+            due = now - self._last_flush >= settings.LEARNED_HIT_FLUSH_SECONDS
+        if due:
+            self.flush_hits()
+
+    def flush_hits(self):
+        with self._hits_lock:
+            hits, last_used = self._hits, self._last_used
+            self._hits, self._last_used = Counter(), {}
+            self._last_flush = time.time()
+        if not hits:
+            return
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "UPDATE learned_usage SET hits = hits + ?, last_used = MAX(COALESCE(last_used, 0), ?) WHERE chunk_id = ?",
+                    [(count, last_used[chunk_id], chunk_id) for chunk_id, count in hits.items()],
+                )
+        except sqlite3.Error:
+            # Keep the batch for the next flush rather than losing it
+            with self._hits_lock:
+                self._hits.update(hits)
+                for chunk_id, used in last_used.items():
+                    self._last_used[chunk_id] = max(used, self._last_used.get(chunk_id, 0))
+            raise
+
+    def learned_usage(self) -> List[Dict[str, Any]]:
+        """Usage rows of every learned chunk, joined with its knowledge base type."""
+        self.flush_hits()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT u.chunk_id, c.knowledge_base_type, u.created_at, u.last_used, u.hits
+                FROM learned_usage u JOIN chunks c ON c.chunk_id = u.chunk_id
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def index_keys(self) -> List[Dict[str, Any]]:
+        """chunk_id, knowledge_base_type and is_learned of every chunk, for index maintenance."""
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id, knowledge_base_type, is_learned FROM chunks").fetchall()
+        return [{**dict(row), "is_learned": bool(row["is_learned"])} for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+@lru_cache(maxsize=1)
+def get_chunk_store() -> ChunkStore:
+    store = ChunkStore()
+    logger.info("Chunk store at %s", store.path)
+    return store
@@ -0,0 +1,207 @@
+"""
+Ingest-time chunk condensation.
+
+PDF chunks carry running headers, page numbers, hyphenated line breaks and table
+fragments. `condense` strips those once, offline, and rewrites table rows as compact
+"Header: value" lines so generation prompts carry facts rather than layout. The
+result is stored next to the original text (chunks.condensed) and used for prompts;
+embeddings are still computed from the original text.
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable, List, Optional, Set, Tuple
+from app.core.config import settings, logger
+
+# Explicit cell delimiters; a single row using them is enough to call it a table
+DELIMITER = re.compile(r"\s*\|\s*|\t+")
+# Without delimiters, cells are runs of words separated by 2+ spaces, and rows must line up
+SPACED_CELL = re.compile(r"\S+(?: \S+)*")
+ALIGNMENT_TOLERANCE = 2
+PAGE_NUMBER = re.compile(r"^(page\s*)?[-–—]?\s*\d+\s*[-–—]?(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+BULLET = re.compile(r"^([•●▪◦○■□➢►*-]|\d+[.)]|[a-z][.)])\s+")
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+def _boilerplate_key(line: str) -> str:
+    line = _normalize(line).lower()
+    if PAGE_NUMBER.match(line):
+        # Bare numbers are often table values; only the exact same number repeated counts
+        return line
+    # Running headers often embed the page number
+    return re.sub(r"\d+", "#", line)
+
+def find_boilerplate(pages: Iterable[str], min_fraction: float = 0.5, min_pages: int = 3) -> Set[str]:
+    """Lines repeated on at least min_fraction of a document's pages: running headers and footers."""
+    pages = list(pages)
+    if len(pages) < min_pages:
+        return set()
+    counts = Counter()
+    for page in pages:
+        counts.update({_boilerplate_key(line) for line in page.splitlines() if line.strip()})
+    threshold = max(min_pages, min_fraction * len(pages))
+    return {line for line, count in counts.items() if count >= threshold}
+
+def _delimited_cells(line: str) -> List[str]:
+    if "|" not in line and "\t" not in line:
+        return []
+    cells = [_normalize(cell) for cell in DELIMITER.split(line.strip().strip("|"))]
+    cells = [cell for cell in cells if cell]
+    return cells if len(cells) >= 2 else []
+
+def _spaced_cells(line: str) -> List[Tuple[int, str]]:
+    """(column, text) of each cell, or [] when the line has a single run of text."""
+    cells = [(match.start(), match.group()) for match in SPACED_CELL.finditer(line.rstrip())]
+    return cells if len(cells) >= 2 else []
+
+def _aligned(header: List[Tuple[int, str]], row: List[Tuple[int, str]]) -> bool:
+    return len(row) == len(header) and all(
+        abs(column - header_column) <= ALIGNMENT_TOLERANCE for (column, _), (header_column, _) in zip(row, header)
+    )
+
+def _table_at(lines: List[str], i: int) -> Tuple[List[List[str]], int]:
+    """Rows of the table starting at lines[i] and the index after it, or ([], i) if it isn't one."""
+    rows = []
+    j = i
+    while j < len(lines) and _delimited_cells(lines[j]):
+        rows.append(_delimited_cells(lines[j]))
+        j += 1
+    if len(rows) >= 2:
+        return rows, j
+
+    # Space-separated rows only count when they line up under the header; two-column
+    # runs need an extra row, since two prose lines can line up by chance.
+    header = _spaced_cells(lines[i])
+    if not header:
+        return [], i
+    j = i + 1
+    while j < len(lines) and _aligned(header, _spaced_cells(lines[j])):
+        j += 1
+    if j - i < (2 if len(header) >= 3 else 3):
+        return [], i
+    return [[text for _, text in _spaced_cells(line)] for line in lines[i:j]], j
+
+def _table_lines(rows: List[List[str]]) -> List[str]:
+    """First row is the header; the rest become "Header: value; ..." lines."""
+    header, lines = rows[0], []
+    for row in rows[1:]:
+        if len(row) == len(header):
+            lines.append("; ".join(f"{key}: {value}" for key, value in zip(header, row)))
+        elif lines and len(row) < len(header):
+            # A wrapped cell spilling onto its own line
+            lines[-1] += " " + " ".join(row)
+        else:
+            lines.append("; ".join(row))
+    return lines
+
+def _strip_page_numbers(lines: List[str], page_start: bool, page_end: bool) -> List[str]:
+    """Drops a page number from the ends of the text that are also the ends of the page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    drop = set()
+    if filled and page_start and PAGE_NUMBER.match(_normalize(lines[filled[0]])):
+        drop.add(filled[0])
+    if filled and page_end and PAGE_NUMBER.match(_normalize(lines[filled[-1]])):
+        drop.add(filled[-1])
+    return [line for i, line in enumerate(lines) if i not in drop]
+
+def condense(text: str, boilerplate: Set[str] = frozenset(), page_start: bool = False, page_end: bool = False) -> str:
+    """
+    Whitespace, header and table clean-up for one chunk; wording is left as is.
+    page_start/page_end say whether the chunk begins or ends its page, the only places
+    a bare number is taken for a page number rather than a value.
+    """
+    # Only words are rejoined; "2020-\n21" is a range, not a broken word
+    text = re.sub(r"([A-Za-z])-\n([a-z])", r"\1\2", text)
+    text = re.sub(r"(\d)-\n(\d)", r"\1-\2", text)
+    lines = [raw for raw in text.splitlines() if not raw.strip() or _boilerplate_key(raw) not in boilerplate]
+    lines = _strip_page_numbers(lines, page_start, page_end)
+
+    output: List[str] = []
+    paragraph: List[str] = []
+
+    def flush_paragraph():
+        if paragraph:
+            output.append(" ".join(paragraph))
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = _normalize(lines[i])
+        if not line:
+            flush_paragraph()
+            i += 1
+            continue
+
+        rows, end = _table_at(lines, i)
+        if rows:
+            flush_paragraph()
+            output.extend(_table_lines(rows))
+            i = end
+            continue
+
+        if BULLET.match(line):
+            flush_paragraph()
+            paragraph.append("- " + BULLET.sub("", line))
+        else:
+            # Wrapped prose lines rejoin into one paragraph
+            paragraph.append(line)
+        i += 1
+    flush_paragraph()
+    return "\n".join(output)
+
+SUMMARY_PROMPT = """Rewrite this excerpt from an agricultural reference as compact factual notes.
+Keep every name, number, dose, date, amount and eligibility rule exactly. No introduction or commentary.
+
+{text}"""
+
+class SummaryCache:
+    """LLM summaries keyed by a hash of model and chunk text, kept in the chunk store database."""
+
+    def __init__(self, path: str = None):
+        self._conn = sqlite3.connect(path or settings.CHUNK_STORE_PATH, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_summaries (
+                    chunk_hash TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    summary TEXT NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}:{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM chunk_summaries WHERE chunk_hash = ?", (self.key(model, text),)).fetchone()
+        return row[0] if row else None
+
+    def put(self, model: str, text: str, summary: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_summaries VALUES (?, ?, ?)", (self.key(model, text), model, summary)
+            )
+
+def summarize(text: str, cache: SummaryCache, model: str = None) -> str:
+    """LLM-condensed notes for a chunk, computed once per text; falls back to the input if it isn't shorter."""
+    model = model or settings.GROQ_FAST_MODEL
+    cached = cache.get(model, text)
+    if cached is not None:
+        return cached
+
+    from langchain_groq import ChatGroq
+    try:
+        summary = ChatGroq(model=model, temperature=0).invoke(SUMMARY_PROMPT.format(text=text)).content.strip()
+    except Exception as e:
+        logger.error("Chunk summary failed: %s", e)
+        return text
+    if not summary or len(summary) >= len(text):
+        summary = text
+    cache.put(model, text, summary)
+    return summary
@@ -0,0 +1,364 @@
+"""
+Shared embedding service.
+
+With several API workers each one would load its own copy of the embedding model.
+In "remote" mode a single embedding server process owns the model and the API
+workers talk to it over a local Unix socket. Vectors come back through a shared
+memory segment instead of being pickled over the socket.
+"""
+
+import os
+import queue
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings, logger
+from app.core.metrics import metrics
+
+# Reply segments are reused per connection and only grow when a batch does not fit.
+MIN_SEGMENT_BYTES = 64 * 1024
+FLOAT_SIZE = array("f").itemsize
+
+
+class EmbeddingServerError(RuntimeError):
+    """The server answered with an error; the connection itself is still usable."""
+
+
+def _authkey(create: bool = False) -> bytes:
+    """
+    Connection key: EMBEDDING_SERVICE_AUTHKEY if set, otherwise a random key the server
+    writes (owner-only) to EMBEDDING_SERVICE_KEY_PATH on the volume it shares with the workers.
+    The connection unpickles what clients send, so the key must not be guessable.
+    """
+    if settings.EMBEDDING_SERVICE_AUTHKEY:
+        return settings.EMBEDDING_SERVICE_AUTHKEY.encode("utf-8")
+    path = settings.EMBEDDING_SERVICE_KEY_PATH
+    if create and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(path) as f:
+            return f.read().strip().encode("utf-8")
+    except FileNotFoundError:
+        raise ConnectionError(f"No embedding server key at {path}; start the embedding server or set EMBEDDING_SERVICE_AUTHKEY")
+
+
+class EmbeddingServer:
+    """Owns the embedding model and serves vectors to API workers."""
+
+    def __init__(self, embeddings: Embeddings, address: str = None):
+        self.embeddings = embeddings
+        self.address = address or settings.EMBEDDING_SERVICE_ADDRESS
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.remove(self.address)
+        os.makedirs(os.path.dirname(self.address) or ".", exist_ok=True)
+
+        with Listener(self.address, family="AF_UNIX", authkey=_authkey(create=True)) as listener:
+            os.chmod(self.address, 0o600)
+            logger.info("Embedding server listening on %s", self.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    logger.warning("Rejected embedding client: %s", e)
+                    continue
+                # One thread per API worker connection; the model is shared.
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        segment = None
+        try:
+            while True:
+                try:
+                    op, texts = conn.recv()
+                except EOFError:
+                    break
+
+                if op == "stats":
+                    # Batching runs in this process, so its metrics only exist here
+                    conn.send(("ok", metrics.snapshot(), 0, 0))
+                    continue
+
+                try:
+                    if op == "query":
+                        vectors = [self.embeddings.embed_query(texts[0])]
+                    else:
+                        vectors = self.embeddings.embed_documents(list(texts))
+
+                    rows = len(vectors)
+                    dim = len(vectors[0]) if rows else 0
+                    payload = array("f", [value for vector in vectors for value in vector]).tobytes()
+
+                    if segment is None or segment.size < len(payload):
+                        if segment is not None:
+                            segment.close()
+                            segment.unlink()
+                        segment = shared_memory.SharedMemory(create=True, size=max(len(payload), MIN_SEGMENT_BYTES))
+
+                    segment.buf[:len(payload)] = payload
+                    conn.send(("ok", segment.name, rows, dim))
+                except Exception as e:
+                    logger.error("Embedding server error: %s", e)
+                    conn.send(("error", str(e), 0, 0))
+        finally:
+            conn.close()
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+
+
+class _Channel:
+    """A single connection to the embedding server plus its attached reply segment."""
+
+    def __init__(self, address: str):
+        self.conn = Client(address, family="AF_UNIX", authkey=_authkey())
+        self.segment = None
+
+    def request(self, op: str, texts: List[str]) -> List[List[float]]:
+        self.conn.send((op, texts))
+        status, name, rows, dim = self.conn.recv()
+        if status != "ok":
+            raise EmbeddingServerError(f"Embedding server error: {name}")
+        if rows == 0:
+            return []
+
+        if self.segment is None or self.segment.name != name:
+            if self.segment is not None:
+                self.segment.close()
+            self.segment = shared_memory.SharedMemory(name=name)
+            # The server owns the segment, so keep our resource tracker from unlinking it.
+            resource_tracker.unregister(self.segment._name, "shared_memory")
+
+        flat = array("f")
+        flat.frombytes(bytes(self.segment.buf[:rows * dim * FLOAT_SIZE]))
+        return [flat[i * dim:(i + 1) * dim].tolist() for i in range(rows)]
+
+    def stats(self) -> Dict[str, Any]:
+        self.conn.send(("stats", []))
+        status, snapshot, _, _ = self.conn.recv()
+        if status != "ok":
+            raise EmbeddingServerError(f"Embedding server error: {snapshot}")
+        return snapshot
+
+    def close(self):
+        try:
+            self.conn.close()
+        finally:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings client that forwards requests to the shared embedding server."""
+
+    def __init__(self, address: str = None):
+        self.address = address or settings.EMBEDDING_SERVICE_ADDRESS
+        self._idle: List[_Channel] = []
+        self._lock = threading.Lock()
+
+    def _request(self, op: str, texts: List[str]) -> List[List[float]]:
+        return self._call(lambda channel: channel.request(op, texts))
+
+    def server_metrics(self) -> Dict[str, Any]:
+        """The embedding server's metrics snapshot (batch sizes, queueing delay)."""
+        return self._call(lambda channel: channel.stats())
+
+    def _call(self, use: Callable[[_Channel], Any]) -> Any:
+        with self._lock:
+            channel = self._idle.pop() if self._idle else None
+
+        reusable = False
+        try:
+            if channel is None:
+                channel = _Channel(self.address)
+            result = use(channel)
+            reusable = True
+            return result
+        except EmbeddingServerError:
+            # The reply was read in full, so the channel is still in sync
+            reusable = True
+            raise
+        except (OSError, EOFError) as e:
+            raise ConnectionError(f"Embedding server unavailable at {self.address}: {e}") from e
+        finally:
+            if channel is not None:
+                if reusable:
+                    with self._lock:
+                        self._idle.append(channel)
+                else:
+                    channel.close()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._request("documents", list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request("query", [text])[0]
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Dynamic micro-batching in front of a local model.
+    Concurrent embed_query / small embed_documents calls are queued and run as one forward
+    pass once the batch is full or the oldest caller has waited max_wait_ms. Queries are
+    embedded as documents, which is the same computation for HuggingFaceEmbeddings.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def _submit(self, texts: List[str]) -> List[List[float]]:
+        future = Future()
+        self._queue.put((texts, future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch, size = [first], len(first[0])
+        flush_at = first[2] + self.max_wait
+        while size < self.max_batch_size:
+            wait = flush_at - time.perf_counter()
+            if wait <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+
+            started = time.perf_counter()
+            metrics.observe("embedding_batch.size", len(texts))
+            for _, _, enqueued in batch:
+                metrics.observe("embedding_batch.queue_delay_ms", (started - enqueued) * 1000)
+
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            metrics.observe("embedding_batch.forward_ms", (time.perf_counter() - started) * 1000)
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch_size:
+            # Already a full batch; queueing would only add delay
+            return self.embeddings.embed_documents(texts)
+        return self._submit(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text])[0]
+
+
+def with_batching(embeddings: Embeddings) -> Embeddings:
+    """Wraps a local model in the micro-batcher when EMBEDDING_BATCHING is enabled."""
+    if not settings.EMBEDDING_BATCHING:
+        return embeddings
+    return BatchingEmbeddings(
+        embeddings,
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS
+    )
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    LRU cache of query vectors in front of another embeddings instance.
+    `prime` embeds many questions in a single batch so later `embed_query` calls are cache hits.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 1024):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, text: str, vector: List[float]):
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def prime(self, texts: List[str]):
+        with self._lock:
+            missing = list(dict.fromkeys(t for t in texts if t not in self._cache))
+        if not missing:
+            return
+        for text, vector in zip(missing, self.embeddings.embed_documents(missing)):
+            self._store(text, vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+                return vector
+        vector = self.embeddings.embed_query(text)
+        self._store(text, vector)
+        return vector
+
+
+def embedding_server_metrics() -> Optional[Dict[str, Any]]:
+    """Metrics of the shared embedding server in 'remote' mode, None when the model runs in-process."""
+    if settings.EMBEDDING_SERVICE_MODE != "remote":
+        return None
+    try:
+        return get_embeddings().embeddings.server_metrics()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> CachedQueryEmbeddings:
+    """
+    Process-wide embeddings instance.
+    Loads the model locally once, or connects to the shared embedding server in 'remote' mode.
+    """
+    if settings.EMBEDDING_SERVICE_MODE == "remote":
+        logger.info("Using shared embedding server at %s", settings.EMBEDDING_SERVICE_ADDRESS)
+        embeddings = RemoteEmbeddings()
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = with_batching(HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL))
+
+    return CachedQueryEmbeddings(embeddings, max_size=settings.QUERY_EMBEDDING_CACHE_SIZE)
@@ -0,0 +1,53 @@
+"""
+Vector index layout.
+
+"filter" keeps every vector in the default namespace and narrows queries with a
+metadata filter on knowledge_base_type. "namespace" partitions vectors by knowledge
+base and source ("disease-curated", "hybrid-learned", ...), so a query only scans
+its own partitions and learned content no longer grows the curated search space.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+
+KNOWLEDGE_BASES = ("disease", "scheme", "hybrid")
+SOURCES = ("curated", "learned")
+
+DEFAULT_NAMESPACE = ""
+
+# Vectors written before the chunk store carry their text in this metadata field
+LEGACY_TEXT_KEY = "text"
+FETCH_BATCH_SIZE = 100
+
+def namespace_for(knowledge_base_type: str, is_learned: bool) -> str:
+    return f"{knowledge_base_type}-{'learned' if is_learned else 'curated'}"
+
+def partitions(container_tag: str = None) -> List[str]:
+    """Namespaces holding a knowledge base's vectors, or every namespace without a tag."""
+    tags = [container_tag] if container_tag else KNOWLEDGE_BASES
+    return [f"{tag}-{source}" for tag in tags for source in SOURCES]
+
+def write_namespace(knowledge_base_type: str, is_learned: bool, layout: str = None) -> str:
+    """Where a new vector goes under the given (default: configured) layout."""
+    if (layout or settings.INDEX_LAYOUT) == "namespace":
+        return namespace_for(knowledge_base_type, is_learned)
+    return DEFAULT_NAMESPACE
+
+def query_targets(container_tag: str = None, layout: str = None) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """(namespace, metadata filter) pairs a query must cover; results are merged by score."""
+    if (layout or settings.INDEX_LAYOUT) == "namespace":
+        return [(namespace, None) for namespace in partitions(container_tag)]
+    return [(DEFAULT_NAMESPACE, {"knowledge_base_type": container_tag} if container_tag else None)]
+
+def iter_legacy_vectors(index, namespace: str = DEFAULT_NAMESPACE) -> Iterator[Tuple[str, Dict[str, Any], List[float]]]:
+    """
+    (id, metadata, values) of vectors written before the chunk store (random IDs, text inline).
+    Listing IDs needs a serverless index; pod-based indexes raise here.
+    """
+    for ids in index.list(namespace=namespace):
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            fetched = index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE], namespace=namespace).vectors
+            for vector_id, vector in fetched.items():
+                metadata = vector.metadata or {}
+                if LEGACY_TEXT_KEY in metadata:
+                    yield vector_id, metadata, vector.values
@@ -0,0 +1,36 @@
+"""
+Eviction policy for learned knowledge.
+
+Learned chunks leave the index when they are past LEARNED_TTL_DAYS, unused for
+LEARNED_COLD_DAYS, or, coldest first, once there are more than LEARNED_MAX_CHUNKS.
+"""
+
+import time
+from typing import Any, Dict, List
+from app.core.config import settings
+
+DAY_SECONDS = 86400
+
+def plan_eviction(usage: List[Dict[str, Any]], now: float = None, ttl_days: float = None,
+                  cold_days: float = None, max_chunks: int = None) -> Dict[str, str]:
+    """Maps the chunk_id of every learned chunk to evict to its reason: "ttl", "cold" or "budget"."""
+    now = now or time.time()
+    ttl = (ttl_days if ttl_days is not None else settings.LEARNED_TTL_DAYS) * DAY_SECONDS
+    cold = (cold_days if cold_days is not None else settings.LEARNED_COLD_DAYS) * DAY_SECONDS
+    max_chunks = max_chunks if max_chunks is not None else settings.LEARNED_MAX_CHUNKS
+
+    evict, kept = {}, []
+    for row in usage:
+        last_active = row["last_used"] or row["created_at"]
+        if now - row["created_at"] > ttl:
+            evict[row["chunk_id"]] = "ttl"
+        elif now - last_active > cold:
+            evict[row["chunk_id"]] = "cold"
+        else:
+            kept.append(row)
+
+    # Over budget: drop the least recently used, fewest hits first
+    kept.sort(key=lambda row: (row["last_used"] or row["created_at"], row["hits"]))
+    for row in kept[:max(0, len(kept) - max_chunks)]:
+        evict[row["chunk_id"]] = "budget"
+    return evict
@@ -1,84 +1,175 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
-from langchain_pinecone import PineconeVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
+from functools import lru_cache
+from pinecone import Pinecone
+from app.services.retrieval.embedding_service import get_embeddings
+from app.services.retrieval.chunk_store import get_chunk_store, make_learned_chunk_id, prompt_text
+from app.services.retrieval.index_layout import query_targets, write_namespace
 from app.core.config import settings, logger
+from app.core.resilience import call_upstream
+
+# Fields the chunk store hands back to callers as result metadata
+METADATA_FIELDS = ("chunk_id", "document_name", "page_number", "knowledge_base_type", "source_url", "is_learned")
+
+# Pinecone accepts at most 1000 IDs per delete
+DELETE_BATCH_SIZE = 1000
+
+# Partitioned queries fan out here, one query per namespace
+_partition_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pinecone-partitions")
 
 class PineconeRetriever:
     def __init__(self):
         self.api_key = settings.PINECONE_API_KEY
         self.index_name = settings.PINECONE_INDEX_NAME
         
-        # Initialize embeddings
-        self.embeddings = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        # Shared per process (or per host via the embedding server)
+        self.embeddings = get_embeddings()
+        self.chunk_store = get_chunk_store()
         
-        # Initialize VectorStore
+        # The index only holds vectors, chunk IDs and filter fields; text lives in the chunk store
         if self.api_key and self.index_name:
-            self.vectorstore = PineconeVectorStore(
-                index_name=self.index_name,
-                embedding=self.embeddings,
-                pinecone_api_key=self.api_key
-            )
+            self.index = Pinecone(api_key=self.api_key).Index(self.index_name)
         else:
-            self.vectorstore = None
+            self.index = None
             logger.warning("PINECONE_API_KEY or PINECONE_INDEX_NAME not found in settings.")
 
-    def retrieve(self, query: str, container_tag: str = None, top_k: int = 4) -> List[Dict[str, Any]]:
+    def _hydrate(self, matches) -> List[Dict[str, Any]]:
+        """Rebuilds results from the chunk store in one batched lookup."""
+        chunks = self.chunk_store.get_many([match.id for match in matches])
+        
+        processed_results = []
+        for match in matches:
+            chunk = chunks.get(match.id)
+            metadata = dict(match.metadata or {})
+            if chunk is not None:
+                metadata.update({field: chunk[field] for field in METADATA_FIELDS if chunk.get(field) is not None})
+                content = prompt_text(chunk)
+            elif "text" in metadata:
+                # Vectors ingested before the chunk store carry their text inline
+                content = metadata.pop("text")
+            else:
+                logger.warning("Chunk %s missing from local chunk store. Skipping.", match.id)
+                continue
+            
+            processed_results.append({
+                "id": match.id,
+                "content": content,
+                "metadata": metadata,
+                "score": match.score
+            })
+        return processed_results
+
+    def record_usage(self, results: List[Dict[str, Any]]):
+        """Counts a hit on each learned result that made it into an answer's context."""
+        learned = [result["id"] for result in results if (result.get("metadata") or {}).get("is_learned")]
+        if not learned:
+            return
+        try:
+            self.chunk_store.record_hits(learned)
+        except Exception as e:
+            logger.error("Failed to record learned chunk usage: %s", e)
+
+    def _query(self, vector: List[float], namespace: str, filter_dict: Dict[str, Any], top_k: int, deadline: float = None):
+        response = call_upstream(
+            "pinecone",
+            self.index.query,
+            vector=vector,
+            top_k=top_k,
+            namespace=namespace,
+            filter=filter_dict,
+            include_metadata=True,
+            deadline=deadline
+        )
+        return response.matches
+
+    def retrieve(self, query: str, container_tag: str = None, top_k: int = 4, deadline: float = None) -> List[Dict[str, Any]]:
         """
         Query Pinecone knowledge base. 
-        Filters by 'knowledge_base_type' in metadata if container_tag is provided.
+        With INDEX_LAYOUT=filter, filters by 'knowledge_base_type' in metadata if container_tag is provided.
+        With INDEX_LAYOUT=namespace, queries the tag's curated and learned namespaces in parallel and merges by score.
+        Each query is bounded by the request deadline and may be hedged (see app/core/resilience.py).
         """
-        if not self.vectorstore:
-            logger.error("Pinecone VectorStore not initialized.")
+        if not self.index:
+            logger.error("Pinecone index not initialized.")
             return []
 
-        filter_dict = {}
-        if container_tag:
-            filter_dict = {"knowledge_base_type": container_tag}
+        try:
+            vector = self.embeddings.embed_query(query)
+            targets = query_targets(container_tag)
+            if len(targets) == 1:
+                namespace, filter_dict = targets[0]
+                return self._hydrate(self._query(vector, namespace, filter_dict, top_k, deadline))
+
+            futures = [
+                _partition_pool.submit(contextvars.copy_context().run, self._query, vector, namespace, filter_dict, top_k, deadline)
+                for namespace, filter_dict in targets
+            ]
+        except Exception as e:
+            logger.error("Pinecone Search Exception: %s", e)
+            return []
 
+        matches = []
+        for (namespace, _), future in zip(targets, futures):
+            try:
+                matches += future.result()
+            except Exception as e:
+                logger.error("Pinecone Search Exception in namespace %s: %s", namespace, e)
+        matches.sort(key=lambda match: match.score or 0.0, reverse=True)
         try:
-            docs = self.vectorstore.similarity_search(
-                query, 
-                k=top_k,
-                filter=filter_dict if filter_dict else None
-            )
-            
-            processed_results = []
-            for doc in docs:
-                processed_results.append({
-                    "content": doc.page_content,
-                    "metadata": doc.metadata
-                })
-            return processed_results
+            return self._hydrate(matches[:top_k])
         except Exception as e:
-            logger.error(f"Pinecone Search Exception: {str(e)}")
+            logger.error("Chunk store lookup failed: %s", e)
             return []
 
     def add_learned_knowledge(self, content: str, source_url: str, intent: str):
         """
-        Upserts newly discovered knowledge into Pinecone.
+        Stores newly discovered knowledge locally and upserts its vector into Pinecone.
         """
-        if not self.vectorstore:
+        if not self.index:
             return
             
-        metadata = {
+        chunk_id = make_learned_chunk_id(source_url, content)
+        chunk = {
+            "chunk_id": chunk_id,
             "document_name": "Web Search (Learned)",
             "source_url": source_url,
             "knowledge_base_type": intent,
+            "content": content,
             "is_learned": True
         }
         
         try:
-            self.vectorstore.add_texts(
-                texts=[content],
-                metadatas=[metadata]
-            )
-            logger.info(f"Learned new information for {intent}")
+            call_upstream("pinecone", self.index.upsert, vectors=[{
+                "id": chunk_id,
+                "values": self.embeddings.embed_documents([content])[0],
+                "metadata": {"knowledge_base_type": intent, "is_learned": True}
+            }], namespace=write_namespace(intent, True))
+            # Stored only once the vector exists, so a failed upsert leaves no orphan learned row
+            self.chunk_store.put_many([chunk])
+            logger.info("Learned new information for %s", intent)
         except Exception as e:
-            logger.error(f"Error learning knowledge: {e}")
+            logger.error("Error learning knowledge: %s", e)
+
+    def delete_learned(self, chunks: List[Dict[str, Any]]):
+        """Removes learned vectors (dicts with chunk_id and knowledge_base_type) from the index."""
+        if not self.index:
+            return
+        by_namespace = {}
+        for chunk in chunks:
+            by_namespace.setdefault(write_namespace(chunk["knowledge_base_type"], True), []).append(chunk["chunk_id"])
+        for namespace, ids in by_namespace.items():
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                call_upstream("pinecone", self.index.delete, ids=ids[start:start + DELETE_BATCH_SIZE], namespace=namespace)
+
+@lru_cache(maxsize=1)
+def get_retriever() -> PineconeRetriever:
+    """Process-wide retriever so the Pinecone client and embeddings are created once."""
+    return PineconeRetriever()
 
 def get_hybrid_context(query: str) -> str:
     """Combines context from both disease and scheme tags."""
-    retriever = PineconeRetriever()
+    retriever = get_retriever()
     disease_chunks = retriever.retrieve(query, container_tag="disease", top_k=3)
     scheme_chunks = retriever.retrieve(query, container_tag="scheme", top_k=3)
     
@@ -98,4 +189,4 @@ if __name__ == "__main__":
     retriever = PineconeRetriever()
     results = retriever.retrieve("Citrus Canker prevention", container_tag="disease")
     for r in results:
-        logger.info(f"Found: {r.get('content')[:100]}...")
+        logger.info("Found: %s...", r.get('content')[:100])
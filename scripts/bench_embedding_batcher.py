@@ -0,0 +1,85 @@
+"""
+Measures query-embedding throughput against concurrency, with and without micro-batching.
+
+    python scripts/bench_embedding_batcher.py                       # the configured EMBEDDING_MODEL
+    python scripts/bench_embedding_batcher.py --simulate            # fixed-cost fake model, no download
+    python scripts/bench_embedding_batcher.py --concurrency 1 8 32 --requests 256
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.retrieval.embedding_service import BatchingEmbeddings
+
+class SimulatedEmbeddings:
+    """
+    A forward pass costs a fixed overhead plus a per-text cost, like a small model on CPU.
+    Passes run one at a time, as they would on a single saturated device.
+    """
+
+    def __init__(self, call_ms: float, per_text_ms: float, dim: int = 1024):
+        self.call_ms = call_ms
+        self.per_text_ms = per_text_ms
+        self.dim = dim
+        self._device = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._device:
+            time.sleep((self.call_ms + self.per_text_ms * len(texts)) / 1000)
+        return [[0.0] * self.dim for _ in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def run(embeddings, concurrency, requests):
+    questions = [f"How do I treat citrus canker on tree {i}?" for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embeddings.embed_query, questions))
+    return requests / (time.perf_counter() - start)
+
+def bench(levels, requests, simulate=False, max_wait_ms=None, max_batch_size=None):
+    if simulate:
+        model = SimulatedEmbeddings(call_ms=15, per_text_ms=1)
+        print("🧪 Using simulated model (15 ms per call + 1 ms per text)")
+    else:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        print(f"📦 Loading {settings.EMBEDDING_MODEL}...")
+        model = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+        model.embed_query("warm up")
+
+    batcher = BatchingEmbeddings(
+        model,
+        max_batch_size=max_batch_size or settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_BATCH_MAX_WAIT_MS
+    )
+
+    print(f"\n{'concurrency':>11} | {'direct q/s':>10} | {'batched q/s':>11} | {'speedup':>7} | {'avg batch':>9} | {'p95 wait':>8}")
+    print("-" * 72)
+    for concurrency in levels:
+        direct = run(model, concurrency, requests)
+        metrics.reset()
+        batched = run(batcher, concurrency, requests)
+        observations = metrics.snapshot()["observations"]
+        size = observations.get("embedding_batch.size", {})
+        delay = observations.get("embedding_batch.queue_delay_ms", {})
+        print(f"{concurrency:>11} | {direct:>10.1f} | {batched:>11.1f} | {batched / direct:>6.2f}x | "
+              f"{size.get('mean', 0):>9.1f} | {delay.get('p95', 0):>6.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding micro-batching.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="Concurrent callers to test.")
+    parser.add_argument("--requests", type=int, default=200, help="Queries per concurrency level.")
+    parser.add_argument("--simulate", action="store_true", help="Use a fixed-cost fake model instead of loading EMBEDDING_MODEL.")
+    parser.add_argument("--max-wait-ms", type=float, default=None, help="Override EMBEDDING_BATCH_MAX_WAIT_MS.")
+    parser.add_argument("--max-batch-size", type=int, default=None, help="Override EMBEDDING_BATCH_MAX_SIZE.")
+    args = parser.parse_args()
+    bench(args.concurrency, args.requests, args.simulate, args.max_wait_ms, args.max_batch_size)
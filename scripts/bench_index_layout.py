@@ -0,0 +1,136 @@
+"""
+Compares query latency of the filter and namespace index layouts as learned content grows.
+
+Both layouts must be populated (run scripts/migrate_index_layout.py --to namespace
+without --delete-source). Synthetic learned vectors are added to both layouts at each
+step and deleted at the end.
+
+    python scripts/bench_index_layout.py
+    python scripts/bench_index_layout.py --learned 0 2000 10000 --repeats 20
+"""
+
+import os
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pinecone import Pinecone
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.retrieval.embedding_service import get_embeddings
+from app.services.retrieval.index_layout import KNOWLEDGE_BASES, namespace_for, query_targets
+
+QUESTIONS = [
+    "My citrus leaves are showing yellow blotchy patches. What could this be?",
+    "How do I prevent Citrus Canker in my orchard?",
+    "What treatment should I use for whitefly infestation on my citrus trees?",
+    "What government schemes are available for citrus farmers in Andhra Pradesh?",
+    "Are there any subsidies for setting up drip irrigation in my citrus farm?",
+    "How can I get financial help to start organic citrus farming?",
+]
+SYNTHETIC_PREFIX = "bench-learned-"
+UPSERT_BATCH_SIZE = 100
+
+def random_vector(dimension):
+    vector = [random.gauss(0, 1) for _ in range(dimension)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+def add_synthetic_learned(index, dimension, start, stop):
+    """Adds the same synthetic learned vectors to both layouts."""
+    for batch_start in range(start, stop, UPSERT_BATCH_SIZE):
+        by_namespace = {}
+        for i in range(batch_start, min(stop, batch_start + UPSERT_BATCH_SIZE)):
+            kb_type = KNOWLEDGE_BASES[i % len(KNOWLEDGE_BASES)]
+            record = {
+                "id": f"{SYNTHETIC_PREFIX}{i}",
+                "values": random_vector(dimension),
+                "metadata": {"knowledge_base_type": kb_type, "is_learned": True}
+            }
+            by_namespace.setdefault("", []).append(record)
+            by_namespace.setdefault(namespace_for(kb_type, True), []).append(record)
+        for namespace, records in by_namespace.items():
+            index.upsert(vectors=records, namespace=namespace)
+
+def wait_for_count(index, expected, timeout=120):
+    """Waits until the default namespace reports at least `expected` vectors (upserts are eventually consistent)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        namespaces = index.describe_index_stats().namespaces
+        default = namespaces.get("") or namespaces.get("__default__")
+        if default and default.vector_count >= expected:
+            return
+        time.sleep(2)
+    print(f"⚠️ Index did not report {expected} vectors within {timeout}s; results may undercount.")
+
+def query_layout(index, pool, vector, tag, layout, top_k):
+    targets = query_targets(tag, layout)
+    start = time.perf_counter()
+    calls = [
+        pool.submit(index.query, vector=vector, top_k=top_k, namespace=namespace, filter=filter_dict, include_metadata=True)
+        for namespace, filter_dict in targets
+    ]
+    matches = [match for call in calls for match in call.result().matches]
+    matches.sort(key=lambda match: match.score or 0.0, reverse=True)
+    return (time.perf_counter() - start) * 1000
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def bench(levels, repeats, top_k, keep):
+    api_key = os.getenv("PINECONE_API_KEY")
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not api_key or not index_name:
+        print("❌ Error: PINECONE_API_KEY or PINECONE_INDEX_NAME not found in environment variables.")
+        return
+
+    index = Pinecone(api_key=api_key).Index(index_name)
+    stats = index.describe_index_stats()
+    default = stats.namespaces.get("") or stats.namespaces.get("__default__")
+    baseline = default.vector_count if default else 0
+    print(f"📊 {index_name}: {stats.total_vector_count} vectors, {len(stats.namespaces)} namespaces")
+
+    embeddings = get_embeddings()
+    vectors = embeddings.embed_documents(QUESTIONS)
+    pool = ThreadPoolExecutor(max_workers=8)
+    added = 0
+
+    print(f"\n{'learned':>8} | {'filter p50':>10} | {'filter p95':>10} | {'namespace p50':>13} | {'namespace p95':>13}")
+    print("-" * 66)
+    try:
+        for level in sorted(levels):
+            if level > added:
+                add_synthetic_learned(index, stats.dimension, added, level)
+                added = level
+                wait_for_count(index, baseline + added)
+
+            timings = {"filter": [], "namespace": []}
+            for _ in range(repeats):
+                for vector in vectors:
+                    for tag in ("disease", "scheme"):
+                        for layout in timings:
+                            timings[layout].append(query_layout(index, pool, vector, tag, layout, top_k))
+
+            print(f"{level:>8} | {percentile(timings['filter'], 50):>8.1f}ms | {percentile(timings['filter'], 95):>8.1f}ms | "
+                  f"{percentile(timings['namespace'], 50):>11.1f}ms | {percentile(timings['namespace'], 95):>11.1f}ms")
+    finally:
+        if added and not keep:
+            print(f"\n🧹 Removing {added} synthetic learned vectors...")
+            for start in range(0, added, 1000):
+                ids = [f"{SYNTHETIC_PREFIX}{i}" for i in range(start, min(added, start + 1000))]
+                index.delete(ids=ids, namespace="")
+                for kb_type in KNOWLEDGE_BASES:
+                    index.delete(ids=ids, namespace=namespace_for(kb_type, True))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark filtered vs namespace-partitioned retrieval latency.")
+    parser.add_argument("--learned", type=int, nargs="+", default=[0, 1000, 5000], help="Synthetic learned vectors to add at each step.")
+    parser.add_argument("--repeats", type=int, default=10, help="Passes over the sample questions per step.")
+    parser.add_argument("--top-k", type=int, default=3, help="Matches per query.")
+    parser.add_argument("--keep", action="store_true", help="Leave the synthetic vectors in the index.")
+    args = parser.parse_args()
+    bench(args.learned, args.repeats, args.top_k, args.keep)
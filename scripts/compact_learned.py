@@ -0,0 +1,157 @@
+"""
+Evicts learned knowledge that is past its TTL, cold, or over the size budget.
+
+    python scripts/compact_learned.py --dry-run       # show what would be evicted
+    python scripts/compact_learned.py                 # evict (archived when LEARNED_ARCHIVE is on)
+    python scripts/compact_learned.py --every 24      # run every 24 hours
+    python scripts/compact_learned.py --drop-legacy   # delete pre-chunk-store learned vectors instead of adopting them
+
+Index size and query latency are reported before and after each compaction.
+Learned vectors written before the chunk store (inline text, random IDs) are first
+adopted into it, so they are tracked and evicted like the rest.
+"""
+
+import argparse
+import time
+from collections import Counter
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.core.config import settings
+from app.services.retrieval.index_layout import DEFAULT_NAMESPACE, LEGACY_TEXT_KEY, iter_legacy_vectors, write_namespace
+from app.services.retrieval.learned_lifecycle import plan_eviction
+from app.services.retrieval.retriever import get_retriever
+
+PROBE_QUESTIONS = [
+    ("How do I prevent Citrus Canker in my orchard?", "disease"),
+    ("What treatment should I use for whitefly infestation on my citrus trees?", "disease"),
+    ("Are there any subsidies for setting up drip irrigation in my citrus farm?", "scheme"),
+    ("What government schemes are available for citrus farmers in Andhra Pradesh?", "scheme"),
+]
+
+def index_size(retriever):
+    stats = retriever.index.describe_index_stats()
+    learned = {name: ns.vector_count for name, ns in stats.namespaces.items() if name.endswith("-learned")}
+    return stats.total_vector_count, learned
+
+def probe_latency(retriever, repeats=5):
+    """p50 / p95 retrieval latency (ms) over a few fixed questions; embeddings are cached after the first pass."""
+    for question, tag in PROBE_QUESTIONS:
+        retriever.retrieve(question, container_tag=tag)
+    samples = []
+    for _ in range(repeats):
+        for question, tag in PROBE_QUESTIONS:
+            start = time.perf_counter()
+            retriever.retrieve(question, container_tag=tag)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+def report(label, retriever):
+    total, learned = index_size(retriever)
+    p50, p95 = probe_latency(retriever)
+    learned_note = f", learned namespaces {learned}" if learned else ""
+    print(f"   {label}: {total} vectors{learned_note} | query p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+    return total
+
+def wait_for_deletes(retriever, expected_total, timeout=60):
+    """Deletes are eventually consistent; give the index stats a moment to catch up."""
+    deadline = time.time() + timeout
+    while time.time() < deadline and index_size(retriever)[0] > expected_total:
+        time.sleep(2)
+
+def adopt_legacy_learned(retriever, store, drop=False, dry_run=False):
+    """
+    Moves learned vectors from before the chunk store under lifecycle tracking: their text goes
+    to the chunk store and the vector is rewritten without it (into its namespace when partitioned).
+    Their age is unknown, so they start as new and are evicted once cold.
+    """
+    try:
+        legacy = [(vector_id, metadata, values) for vector_id, metadata, values in iter_legacy_vectors(retriever.index)
+                  if metadata.get("is_learned")]
+    except Exception as e:
+        print(f"⚠️ Could not list vectors to find legacy learned chunks ({e}).")
+        print("   On pod-based indexes delete them once with index.delete(filter={\"is_learned\": True}) and let the app relearn.")
+        return
+    if not legacy:
+        return
+    print(f"📥 Legacy learned vectors: {len(legacy)} ({'dropping' if drop else 'adopting'})")
+    if dry_run:
+        return
+
+    ids = [vector_id for vector_id, _, _ in legacy]
+    if drop:
+        for start in range(0, len(ids), 1000):
+            retriever.index.delete(ids=ids[start:start + 1000], namespace=DEFAULT_NAMESPACE)
+        return
+
+    store.put_many([
+        {
+            "chunk_id": vector_id,
+            "document_name": metadata.get("document_name", "Web Search (Learned)"),
+            "source_url": metadata.get("source_url"),
+            "knowledge_base_type": metadata.get("knowledge_base_type", "hybrid"),
+            "content": metadata[LEGACY_TEXT_KEY],
+            "is_learned": True
+        }
+        for vector_id, metadata, _ in legacy
+    ])
+    moved = []
+    for vector_id, metadata, values in legacy:
+        kb_type = metadata.get("knowledge_base_type", "hybrid")
+        namespace = write_namespace(kb_type, True)
+        retriever.index.upsert(vectors=[{
+            "id": vector_id,
+            "values": values,
+            "metadata": {"knowledge_base_type": kb_type, "is_learned": True}
+        }], namespace=namespace)
+        if namespace != DEFAULT_NAMESPACE:
+            moved.append(vector_id)
+    for start in range(0, len(moved), 1000):
+        retriever.index.delete(ids=moved[start:start + 1000], namespace=DEFAULT_NAMESPACE)
+
+def compact(dry_run=False, archive=None, drop_legacy=False):
+    archive = settings.LEARNED_ARCHIVE if archive is None else archive
+    retriever = get_retriever()
+    store = retriever.chunk_store
+    if not retriever.index:
+        print("❌ Error: Pinecone index not configured.")
+        return
+
+    adopt_legacy_learned(retriever, store, drop=drop_legacy, dry_run=dry_run)
+    usage = store.learned_usage()
+    evict = plan_eviction(usage)
+    reasons = Counter(evict.values())
+    print(f"🧹 Learned chunks: {len(usage)} (budget {settings.LEARNED_MAX_CHUNKS}, TTL {settings.LEARNED_TTL_DAYS:g}d, "
+          f"cold after {settings.LEARNED_COLD_DAYS:g}d)")
+    print(f"   To evict: {len(evict)} ({', '.join(f'{reason}: {count}' for reason, count in reasons.items()) or 'none'})")
+    if dry_run or not evict:
+        print("✅ Dry run, nothing evicted." if dry_run else "✅ Nothing to evict.")
+        return
+
+    before = report("Before", retriever)
+    retriever.delete_learned([row for row in usage if row["chunk_id"] in evict])
+    if archive:
+        store.archive_many(evict)
+    else:
+        store.delete_many(list(evict))
+    wait_for_deletes(retriever, before - len(evict))
+    report("After ", retriever)
+    print(f"✅ Evicted {len(evict)} learned chunks ({'archived' if archive else 'deleted'}).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evict stale, cold or over-budget learned knowledge.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be evicted.")
+    parser.add_argument("--no-archive", action="store_true", help="Delete evicted chunks instead of archiving them.")
+    parser.add_argument("--every", type=float, default=None, help="Repeat every N hours.")
+    parser.add_argument("--drop-legacy", action="store_true", help="Delete learned vectors from before the chunk store instead of adopting them.")
+    args = parser.parse_args()
+
+    archive = False if args.no_archive else None
+    while True:
+        compact(dry_run=args.dry_run, archive=archive, drop_legacy=args.drop_legacy)
+        if not args.every:
+            break
+        time.sleep(args.every * 3600)
@@ -1,14 +1,19 @@
 import os
 import argparse
+from collections import defaultdict
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_pinecone import PineconeVectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
+from pinecone import Pinecone
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+from app.services.retrieval.chunk_store import ChunkStore, make_chunk_id
+from app.services.retrieval.index_layout import DEFAULT_NAMESPACE, iter_legacy_vectors, write_namespace
+from app.services.retrieval.condense import SummaryCache, condense, find_boilerplate, summarize
+
 # Configuration
 CHUNKING_PARAMS = {
     "chunk_size": 1000,  # Standard chunks for Pinecone
@@ -16,6 +21,7 @@ CHUNKING_PARAMS = {
 }
 
 DATA_DIR = "data"
+UPSERT_BATCH_SIZE = 64
 
 # Mapping files to knowledge base types
 PDF_FILES = {
@@ -23,26 +29,43 @@ PDF_FILES = {
     "GovernmentSchemes.pdf": "scheme"
 }
 
-def ingest_to_pinecone():
+def delete_legacy_curated(index):
+    """Removes curated vectors from before the chunk store; they would duplicate the new ones in top_k."""
+    try:
+        legacy = [vector_id for vector_id, metadata, _ in iter_legacy_vectors(index) if not metadata.get("is_learned")]
+    except Exception as e:
+        print(f"⚠️ Could not list vectors to find legacy chunks ({e}).")
+        print("   If this index was filled before the chunk store, delete its vectors and re-run ingestion.")
+        return
+    for start in range(0, len(legacy), 1000):
+        index.delete(ids=legacy[start:start + 1000], namespace=DEFAULT_NAMESPACE)
+    if legacy:
+        print(f"🧹 Deleted {len(legacy)} legacy curated vectors")
+
+def changed_chunk_ids(store, chunks):
+    """IDs whose stored text differs from the new chunk text (their vectors were built from the old text)."""
+    stored = store.get_many([chunk["chunk_id"] for chunk in chunks])
+    return [chunk["chunk_id"] for chunk in chunks if chunk["chunk_id"] in stored and stored[chunk["chunk_id"]]["content"] != chunk["content"]]
+
+def ingest_to_pinecone(store_only: bool = False, layout: str = None, condense_chunks: bool = False,
+                       summarize_chunks: bool = False, keep_legacy: bool = False, force: bool = False):
     print("🚀 Starting Pinecone ingestion pipeline...")
 
     api_key = os.getenv("PINECONE_API_KEY")
     index_name = os.getenv("PINECONE_INDEX_NAME")
     
-    if not api_key or not index_name:
+    if not store_only and (not api_key or not index_name):
         print("❌ Error: PINECONE_API_KEY or PINECONE_INDEX_NAME not found in environment variables.")
         return
 
-    # Initialize embeddings (1024 dimensions to match index)
-    embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-large-en-v1.5")
-
     # Initialize text splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNKING_PARAMS["chunk_size"],
         chunk_overlap=CHUNKING_PARAMS["chunk_overlap"]
     )
 
-    all_docs = []
+    all_chunks = []
+    summary_cache = SummaryCache() if summarize_chunks else None
 
     for filename, kb_type in PDF_FILES.items():
         file_path = os.path.join(DATA_DIR, filename)
@@ -58,32 +81,91 @@ def ingest_to_pinecone():
         
         # Split documents
         chunks = text_splitter.split_documents(documents)
+        boilerplate = find_boilerplate(page.page_content for page in documents) if condense_chunks else set()
         
-        # Add metadata
-        for chunk in chunks:
-            chunk.metadata.update({
+        # Stable IDs: n-th chunk on a page of a document
+        page_ordinals = defaultdict(int)
+        for position, chunk in enumerate(chunks):
+            page_number = chunk.metadata.get("page", 0) + 1
+            ordinal = page_ordinals[page_number]
+            page_ordinals[page_number] += 1
+            all_chunks.append({
+                "chunk_id": make_chunk_id(filename, page_number, ordinal),
                 "document_name": filename,
-                "page_number": chunk.metadata.get("page", 0) + 1,
-                "knowledge_base_type": kb_type
+                "page_number": page_number,
+                "knowledge_base_type": kb_type,
+                "content": chunk.page_content,
+                "is_learned": False
             })
-            all_docs.append(chunk)
+            if condense_chunks:
+                # Prompts use the condensed text; the vector is still computed from the original
+                last_on_page = position + 1 == len(chunks) or chunks[position + 1].metadata.get("page", 0) + 1 != page_number
+                condensed = condense(chunk.page_content, boilerplate, page_start=ordinal == 0, page_end=last_on_page)
+                all_chunks[-1]["condensed"] = summarize(condensed, summary_cache) if summarize_chunks else condensed
 
-    if not all_docs:
+    if not all_chunks:
         print("⚠️ No documents found to ingest.")
         return
 
-    print(f"✨ Sending {len(all_docs)} chunks to Pinecone index: {index_name}...")
+    store = ChunkStore()
+    if store_only and not force:
+        changed = changed_chunk_ids(store, all_chunks)
+        if changed:
+            print(f"❌ {len(changed)} chunks now have different text than their indexed vectors were built from "
+                  f"(chunking parameters or PDFs changed). Re-run without --store-only to re-embed, or pass --force.")
+            return
+    store.put_many(all_chunks)
+    print(f"💾 Stored {len(all_chunks)} chunks in local chunk store: {store.path}")
+    if condense_chunks:
+        original = sum(len(chunk["content"]) for chunk in all_chunks)
+        condensed = sum(len(chunk["condensed"]) for chunk in all_chunks)
+        print(f"🗜️ Condensed chunk text from {original} to {condensed} characters ({100 * (1 - condensed / max(original, 1)):.0f}% smaller)")
+
+    if store_only:
+        print("✅ Chunk store updated. Vectors left untouched.")
+        return
+
+    # Initialize embeddings (1024 dimensions to match index)
+    embeddings = HuggingFaceEmbeddings(model_name="BAAI/bge-large-en-v1.5")
+    index = Pinecone(api_key=api_key).Index(index_name)
+
+    layout = layout or os.getenv("INDEX_LAYOUT", "filter")
+    print(f"✨ Sending {len(all_chunks)} vectors to Pinecone index: {index_name} ({layout} layout)...")
 
     try:
-        PineconeVectorStore.from_documents(
-            all_docs,
-            embeddings,
-            index_name=index_name,
-            pinecone_api_key=api_key
-        )
+        for start in range(0, len(all_chunks), UPSERT_BATCH_SIZE):
+            batch = all_chunks[start:start + UPSERT_BATCH_SIZE]
+            vectors = embeddings.embed_documents([chunk["content"] for chunk in batch])
+            by_namespace = defaultdict(list)
+            for chunk, vector in zip(batch, vectors):
+                by_namespace[write_namespace(chunk["knowledge_base_type"], False, layout)].append({
+                    "id": chunk["chunk_id"],
+                    "values": vector,
+                    # Only filter fields go to the index; text stays in the chunk store
+                    "metadata": {"knowledge_base_type": chunk["knowledge_base_type"], "is_learned": False}
+                })
+            for namespace, records in by_namespace.items():
+                index.upsert(vectors=records, namespace=namespace)
+        if not keep_legacy:
+            delete_legacy_curated(index)
         print("✅ Pinecone ingestion completed successfully.")
     except Exception as e:
         print(f"❌ Exception during upload: {str(e)}")
 
 if __name__ == "__main__":
-    ingest_to_pinecone()
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the local chunk store and Pinecone.")
+    parser.add_argument("--store-only", action="store_true", help="Re-chunk into the local chunk store without re-embedding.")
+    parser.add_argument("--layout", choices=["filter", "namespace"], default=None, help="Index layout to write (default: INDEX_LAYOUT).")
+    parser.add_argument("--condense", action="store_true", help="Store a condensed copy of each chunk (headers, whitespace and tables cleaned) for prompts.")
+    parser.add_argument("--summarize", action="store_true", help="With --condense, also rewrite each chunk as LLM notes (cached by chunk hash).")
+    parser.add_argument("--keep-legacy", action="store_true", help="Keep curated vectors written before the chunk store (they duplicate results).")
+    parser.add_argument("--force", action="store_true", help="With --store-only, rewrite chunk text even if it no longer matches the indexed vectors.")
+    args = parser.parse_args()
+    ingest_to_pinecone(
+        store_only=args.store_only,
+        layout=args.layout,
+        condense_chunks=args.condense or args.summarize,
+        summarize_chunks=args.summarize,
+        keep_legacy=args.keep_legacy,
+        force=args.force
+    )
@@ -0,0 +1,84 @@
+"""
+Moves existing vectors between index layouts without re-embedding.
+
+    python scripts/migrate_index_layout.py --to namespace                   # copy into per-partition namespaces
+    python scripts/migrate_index_layout.py --to namespace --delete-source   # ...and remove the originals
+    python scripts/migrate_index_layout.py --to filter                      # back to one filtered namespace
+    python scripts/migrate_index_layout.py --to namespace --dry-run         # only count what would move
+
+Chunk IDs, knowledge bases and sources come from the local chunk store. Set
+INDEX_LAYOUT to the new layout once the copy has finished.
+"""
+
+import os
+import argparse
+from collections import defaultdict
+from pinecone import Pinecone
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.retrieval.chunk_store import ChunkStore
+from app.services.retrieval.index_layout import write_namespace
+
+# Pinecone caps fetch requests at 1000 IDs; smaller batches keep upserts under the request size limit
+MIGRATE_BATCH_SIZE = 100
+
+def migrate(to_layout: str, delete_source: bool = False, dry_run: bool = False):
+    from_layout = "filter" if to_layout == "namespace" else "namespace"
+    print(f"🚚 Migrating vectors from the {from_layout} layout to the {to_layout} layout...")
+
+    groups = defaultdict(list)
+    for key in ChunkStore().index_keys():
+        source = write_namespace(key["knowledge_base_type"], key["is_learned"], from_layout)
+        target = write_namespace(key["knowledge_base_type"], key["is_learned"], to_layout)
+        groups[(source, target)].append(key)
+
+    for (source, target), keys in sorted(groups.items()):
+        print(f"   {source or '(default)'} → {target or '(default)'}: {len(keys)} chunks")
+    if dry_run or not groups:
+        print("✅ Dry run, nothing moved." if dry_run else "⚠️ Chunk store is empty, nothing to migrate.")
+        return
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not api_key or not index_name:
+        print("❌ Error: PINECONE_API_KEY or PINECONE_INDEX_NAME not found in environment variables.")
+        return
+    index = Pinecone(api_key=api_key).Index(index_name)
+
+    moved, missing = 0, 0
+    for (source, target), keys in groups.items():
+        for start in range(0, len(keys), MIGRATE_BATCH_SIZE):
+            batch = keys[start:start + MIGRATE_BATCH_SIZE]
+            fetched = index.fetch(ids=[key["chunk_id"] for key in batch], namespace=source).vectors
+            records = [
+                {
+                    "id": key["chunk_id"],
+                    "values": fetched[key["chunk_id"]].values,
+                    "metadata": {"knowledge_base_type": key["knowledge_base_type"], "is_learned": key["is_learned"]}
+                }
+                for key in batch if key["chunk_id"] in fetched
+            ]
+            missing += len(batch) - len(records)
+            if not records:
+                continue
+            index.upsert(vectors=records, namespace=target)
+            if delete_source:
+                index.delete(ids=[record["id"] for record in records], namespace=source)
+            moved += len(records)
+        print(f"   ✔ {source or '(default)'} → {target or '(default)'}")
+
+    print(f"✅ Migrated {moved} vectors ({missing} not found in their source namespace).")
+    if missing:
+        print("   Vectors that were never in the chunk store are not migrated; re-run scripts/ingest_documents.py for them.")
+    print(f"   Set INDEX_LAYOUT={to_layout} and restart the API workers.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move vectors between the filter and namespace index layouts.")
+    parser.add_argument("--to", dest="to_layout", choices=["filter", "namespace"], required=True, help="Layout to migrate to.")
+    parser.add_argument("--delete-source", action="store_true", help="Delete each vector from its old namespace once copied.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many chunks would move.")
+    args = parser.parse_args()
+    migrate(args.to_layout, delete_source=args.delete_source, dry_run=args.dry_run)
@@ -0,0 +1,90 @@
+"""
+Replays recorded graph runs offline (record them with CASSETTE_RECORD=true).
+
+    python scripts/replay_cassettes.py                          # every cassette in CASSETTE_DIR, full speed
+    python scripts/replay_cassettes.py --realtime --limit 50    # sleep for the recorded upstream latencies
+"""
+
+import argparse
+import time
+import tiktoken
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.graph import cassette
+from app.services.graph.workflow import app_graph
+
+def load_token_counter():
+    """cl100k_base token counts, or a ~4 chars/token estimate when the encoding can't be loaded offline."""
+    try:
+        encoder = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoder.encode(text))
+    except Exception:
+        print("⚠️ tiktoken encoding unavailable, estimating tokens as chars / 4")
+        return lambda text: len(text) // 4
+
+def count_prompt_tokens(count_tokens, events):
+    """Tokens of every generation prompt."""
+    return sum(
+        count_tokens(message["content"])
+        for event in events if event["kind"] == "generate"
+        for message in event.get("details", {}).get("messages", [])
+    )
+
+def replay(paths=None, realtime=False, limit=None):
+    count_tokens = load_token_counter()
+    replayed, diverged = 0, 0
+    overheads, recorded_totals, recorded_overheads = [], [], []
+    recorded_tokens, replayed_tokens = 0, 0
+
+    print(f"🎞️ Replaying cassettes ({'recorded latencies' if realtime else 'full speed'})...")
+
+    for i, run in enumerate(cassette.load_runs(paths)):
+        if limit and i >= limit:
+            break
+
+        initial_state = {"question": run["question"], "session_id": f"replay-{i}"}
+        config = {"configurable": {"thread_id": f"replay-{i}"}}
+
+        start = time.perf_counter()
+        try:
+            with cassette.playback(run, realtime=realtime) as tape:
+                app_graph.invoke(initial_state, config=config)
+        except cassette.CassetteMiss as e:
+            diverged += 1
+            print(f"⚠️ Run {i} diverged from its recording: {e}")
+            continue
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        # Whatever isn't upstream wall time (overlapping calls counted once) is graph, prompt-building and state overhead
+        overheads.append(wall_ms - (cassette.upstream_ms(tape.waits) if realtime else 0))
+        recorded_totals.append(run.get("total_ms", 0))
+        recorded_upstream = cassette.recorded_upstream_ms(run)
+        if recorded_upstream is not None:
+            recorded_overheads.append(run.get("total_ms", 0) - recorded_upstream)
+        recorded_tokens += count_prompt_tokens(count_tokens, run["events"])
+        replayed_tokens += count_prompt_tokens(count_tokens, tape.observed)
+        replayed += 1
+
+    if not replayed:
+        print("⚠️ No runs replayed.")
+        return
+
+    overheads.sort()
+    p95 = overheads[min(len(overheads) - 1, int(len(overheads) * 0.95))]
+    print(f"✅ Replayed {replayed} runs ({diverged} diverged)")
+    print(f"   Recorded end-to-end: {sum(recorded_totals) / replayed:.1f} ms/run")
+    if recorded_overheads:
+        print(f"   Recorded overhead:   {sum(recorded_overheads) / len(recorded_overheads):.1f} ms/run (outside upstream calls)")
+    print(f"   Graph overhead:      {sum(overheads) / replayed:.1f} ms/run (p95 {p95:.1f} ms)")
+    print(f"   Prompt tokens:       {recorded_tokens / replayed:.0f} recorded vs {replayed_tokens / replayed:.0f} replayed per run")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-execute recorded graph runs against their cassettes.")
+    parser.add_argument("paths", nargs="*", help="Cassette files (default: all in CASSETTE_DIR).")
+    parser.add_argument("--realtime", action="store_true", help="Sleep for each recorded upstream latency.")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many runs.")
+    args = parser.parse_args()
+    replay(args.paths, realtime=args.realtime, limit=args.limit)
@@ -0,0 +1,82 @@
+"""
+Reports the generation-prompt tokens saved by ingest-time condensation
+(python scripts/ingest_documents.py --condense).
+
+    python scripts/report_condensation.py               # live retrieval for sample questions
+    python scripts/report_condensation.py --cassettes   # chunks retrieved in recorded runs (CASSETTE_DIR)
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from app.services.graph import cassette
+from app.services.graph.workflow import RETRIEVAL_PLAN, format_source
+from app.services.retrieval.chunk_store import get_chunk_store
+from app.services.retrieval.retriever import get_retriever
+from scripts.replay_cassettes import load_token_counter
+
+SAMPLE_QUESTIONS = [
+    ("My citrus leaves are showing yellow blotchy patches. What could this be?", "disease"),
+    ("How do I prevent Citrus Canker in my orchard?", "disease"),
+    ("What treatment should I use for whitefly infestation on my citrus trees?", "disease"),
+    ("What government schemes are available for citrus farmers in Andhra Pradesh?", "scheme"),
+    ("Are there any subsidies for setting up drip irrigation in my citrus farm?", "scheme"),
+    ("Which subsidies help me control citrus greening on my farm?", "hybrid"),
+]
+
+def live_queries():
+    """Chunk IDs the retrieval plan returns for each sample question."""
+    retriever = get_retriever()
+    for question, intent in SAMPLE_QUESTIONS:
+        ids = []
+        for tag, k in RETRIEVAL_PLAN[intent].items():
+            ids += [result["id"] for result in retriever.retrieve(question, container_tag=tag, top_k=k)]
+        yield question, ids
+
+def recorded_queries(limit=None):
+    """Chunk IDs retrieved in recorded runs."""
+    for i, run in enumerate(cassette.load_runs()):
+        if limit and i >= limit:
+            break
+        ids = [item["id"] for event in run["events"] if event["kind"] == "retrieve" for item in event.get("result") or []]
+        yield run["question"], ids
+
+def context_tokens(count_tokens, chunks, field):
+    return count_tokens("".join(format_source(chunk.get(field) or chunk["content"], chunk) for chunk in chunks))
+
+def report(use_cassettes=False, limit=None):
+    count_tokens = load_token_counter()
+    store = get_chunk_store()
+    queries = recorded_queries(limit) if use_cassettes else live_queries()
+
+    print(f"🗜️ Prompt context tokens, original vs condensed ({'recorded runs' if use_cassettes else 'sample questions'}):")
+    totals = [0, 0]
+    measured = 0
+    for question, ids in queries:
+        found = store.get_many(ids)
+        chunks = [found[chunk_id] for chunk_id in ids if chunk_id in found]
+        if not chunks:
+            continue
+        original = context_tokens(count_tokens, chunks, "content")
+        condensed = context_tokens(count_tokens, chunks, "condensed")
+        totals[0] += original
+        totals[1] += condensed
+        measured += 1
+        print(f"   {original:>5} → {condensed:>5} tokens | {question[:70]}")
+
+    if not measured:
+        print("⚠️ No retrieved chunks found in the chunk store.")
+        return
+    saved = (totals[0] - totals[1]) / measured
+    print(f"✅ {measured} queries: {totals[0] / measured:.0f} → {totals[1] / measured:.0f} context tokens per query "
+          f"({saved:.0f} saved, {100 * saved / max(totals[0] / measured, 1):.0f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt tokens saved per query by condensed chunks.")
+    parser.add_argument("--cassettes", action="store_true", help="Use chunks retrieved in recorded runs instead of live queries.")
+    parser.add_argument("--limit", type=int, default=None, help="With --cassettes, read at most this many runs.")
+    args = parser.parse_args()
+    report(use_cassettes=args.cassettes, limit=args.limit)
@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# Settings are read at import time; tests never talk to the real services
+for key in ("GROQ_API_KEY", "PINECONE_API_KEY", "PINECONE_INDEX_NAME"):
+    os.environ.setdefault(key, "test")
+
+# Keep stores and cassettes created by the app modules out of ./db
+_scratch = tempfile.mkdtemp(prefix="agri-cult-tests-")
+os.environ.setdefault("CHUNK_STORE_PATH", os.path.join(_scratch, "chunks.sqlite3"))
+os.environ.setdefault("CASSETTE_DIR", os.path.join(_scratch, "cassettes"))
+os.environ.setdefault("EMBEDDING_SERVICE_ADDRESS", os.path.join(_scratch, "embedding.sock"))
+os.environ.setdefault("EMBEDDING_SERVICE_KEY_PATH", os.path.join(_scratch, "embedding.key"))
@@ -0,0 +1,43 @@
+import pytest
+from app.core.config import settings
+from app.services.graph import cassette
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CASSETTE_RECORD", True)
+    monkeypatch.setattr(cassette, "_writer", cassette.CassetteWriter(directory=str(tmp_path)))
+    return cassette._writer
+
+def test_record_then_replay(writer):
+    calls = []
+    def search(question):
+        calls.append(question)
+        return [{"content": f"result for {question}"}]
+
+    with cassette.recording("What is canker?", "s1"):
+        live = cassette.taped("search", None, search, "What is canker?")
+        cassette.taped("classify", None, lambda: "disease")
+    cassette.flush_writes()
+
+    [run] = list(cassette.load_runs([writer.path]))
+    assert run["question"] == "What is canker?" and run["intent"] == "disease"
+
+    with cassette.playback(run):
+        assert cassette.replaying()
+        assert cassette.taped("search", None, search, "What is canker?") == live
+        with pytest.raises(cassette.CassetteMiss):
+            cassette.taped("search", None, search, "again")
+    assert calls == ["What is canker?"]
+
+def test_encode_and_decode_round_trip(writer):
+    with cassette.recording("q"):
+        cassette.taped("grade", None, lambda: {1, 2}, encode=sorted, decode=frozenset)
+    cassette.flush_writes()
+    [run] = list(cassette.load_runs([writer.path]))
+    assert run["events"][0]["result"] == [1, 2]
+    with cassette.playback(run):
+        assert cassette.taped("grade", None, lambda: None, decode=frozenset) == frozenset({1, 2})
+
+def test_upstream_time_counts_overlaps_once():
+    assert cassette.upstream_ms([(0, 100), (50, 120), (200, 250)]) == 170
+    assert cassette.recorded_upstream_ms({"events": [{"latency_ms": 5}]}) is None
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from app.services.retrieval.chunk_store import ChunkStore, make_chunk_id
+from app.services.retrieval.retriever import PineconeRetriever
+
+def chunk(chunk_id, content, **fields):
+    return {"chunk_id": chunk_id, "document_name": "doc.pdf", "page_number": 3,
+            "knowledge_base_type": "disease", "content": content, "is_learned": False, **fields}
+
+def test_put_get_and_delete(tmp_path):
+    store = ChunkStore(path=str(tmp_path / "chunks.sqlite3"), cache_size=1)
+    store.put_many([chunk("a", "first"), chunk("b", "second")])
+    assert store.get_many(["a", "b", "missing"]).keys() == {"a", "b"}
+
+    # Rewrites must not be served from the hot cache
+    store.put_many([chunk("b", "second, rewritten")])
+    assert store.get_many(["b"])["b"]["content"] == "second, rewritten"
+
+    store.delete_many(["a"])
+    assert store.get_many(["a"]) == {} and store.count() == 1
+
+def test_chunk_ids_are_stable():
+    assert make_chunk_id("doc.pdf", 3, 0) == make_chunk_id("doc.pdf", 3, 0) != make_chunk_id("doc.pdf", 3, 1)
+
+def test_hydrate_uses_store_then_inline_text(tmp_path):
+    retriever = PineconeRetriever.__new__(PineconeRetriever)
+    retriever.chunk_store = ChunkStore(path=str(tmp_path / "chunks.sqlite3"))
+    retriever.chunk_store.put_many([chunk("stored", "from the store")])
+
+    matches = [
+        SimpleNamespace(id="stored", score=0.9, metadata={"knowledge_base_type": "disease"}),
+        SimpleNamespace(id="legacy", score=0.8, metadata={"text": "inline text", "document_name": "old.pdf"}),
+        SimpleNamespace(id="unknown", score=0.7, metadata={}),
+    ]
+    results = retriever._hydrate(matches)
+
+    assert [(r["id"], r["content"]) for r in results] == [("stored", "from the store"), ("legacy", "inline text")]
+    assert results[0]["metadata"]["page_number"] == 3
+    assert "text" not in results[1]["metadata"]
+
+def test_failed_learning_upsert_leaves_no_orphan_row(tmp_path):
+    def upsert(**kwargs):
+        raise TimeoutError("pinecone down")
+
+    retriever = PineconeRetriever.__new__(PineconeRetriever)
+    retriever.chunk_store = ChunkStore(path=str(tmp_path / "chunks.sqlite3"))
+    retriever.embeddings = SimpleNamespace(embed_documents=lambda texts: [[0.0] for _ in texts])
+    retriever.index = SimpleNamespace(upsert=upsert)
+    retriever.add_learned_knowledge("web snippet", "https://example.org", "scheme")
+    assert retriever.chunk_store.count() == 0 and retriever.chunk_store.learned_usage() == []
+
+    retriever.index = SimpleNamespace(upsert=lambda **kwargs: None)
+    retriever.add_learned_knowledge("web snippet", "https://example.org", "scheme")
+    assert retriever.chunk_store.count() == 1 and len(retriever.chunk_store.learned_usage()) == 1
@@ -0,0 +1,50 @@
+from app.services.retrieval.condense import condense, find_boilerplate
+
+def test_running_headers_are_detected():
+    bodies = ["Canker spreads in rain.", "Greening is spread by psyllids.", "Prune after harvest.", "Spray copper.", "Check roots."]
+    pages = [f"Citrus Pests and Diseases  {n}\n{body}" for n, body in enumerate(bodies, 1)]
+    assert find_boilerplate(pages) == {"citrus pests and diseases #"}
+
+def test_condense_strips_layout_and_flattens_tables():
+    text = (
+        "Citrus Pests and Diseases  12\n"
+        "Canker   is a bacterial dis-\n"
+        "ease of citrus.\n"
+        "\n"
+        "Disease    Symptom        Control\n"
+        "Canker     Corky lesions  Copper spray 3 g/L\n"
+        "Greening   Yellow shoots  Remove trees\n"
+        "\n"
+        "• Prune infected twigs\n"
+        "12\n"
+    )
+    condensed = condense(text, find_boilerplate([text.split("\n", 1)[0]] * 3), page_start=True, page_end=True)
+    assert condensed == (
+        "Canker is a bacterial disease of citrus.\n"
+        "Disease: Canker; Symptom: Corky lesions; Control: Copper spray 3 g/L\n"
+        "Disease: Greening; Symptom: Yellow shoots; Control: Remove trees\n"
+        "- Prune infected twigs"
+    )
+
+def test_double_spaced_prose_stays_prose():
+    text = (
+        "Citrus canker is caused by  Xanthomonas citri and spreads\n"
+        "in wind-driven rain.  Lesions appear on leaves,\n"
+        "twigs and fruit."
+    )
+    assert condense(text) == (
+        "Citrus canker is caused by Xanthomonas citri and spreads in wind-driven rain. "
+        "Lesions appear on leaves, twigs and fruit."
+    )
+
+def test_delimited_tables_are_flattened():
+    text = "Scheme | Subsidy\nDrip irrigation | 55%\nOrganic inputs | 50%"
+    assert condense(text) == "Scheme: Drip irrigation; Subsidy: 55%\nScheme: Organic inputs; Subsidy: 50%"
+
+def test_standalone_numbers_are_kept():
+    text = "Subsidy amount per hectare\n5000\nMaximum area\n2\nYear of launch\n2015\n"
+    assert condense(text) == "Subsidy amount per hectare 5000 Maximum area 2 Year of launch 2015"
+    assert condense(text, page_end=True) == "Subsidy amount per hectare 5000 Maximum area 2 Year of launch"
+
+def test_year_ranges_are_not_dehyphenated():
+    assert condense("Launched in 2020-\n21 for all districts.") == "Launched in 2020-21 for all districts."
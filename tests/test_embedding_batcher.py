@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from app.services.retrieval.embedding_service import BatchingEmbeddings
+
+class RecordingEmbeddings:
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        if "boom" in texts:
+            raise ValueError("model failed")
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def test_concurrent_queries_share_a_forward_pass():
+    model = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(model, max_batch_size=8, max_wait_ms=50)
+    texts = ["a" * i for i in range(1, 9)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(batcher.embed_query, texts))
+
+    assert vectors == [[float(i)] for i in range(1, 9)]
+    assert len(model.calls) < len(texts)
+
+def test_large_document_lists_bypass_the_queue():
+    model = RecordingEmbeddings()
+    batcher = BatchingEmbeddings(model, max_batch_size=2, max_wait_ms=50)
+    assert batcher.embed_documents(["x", "yy", "zzz"]) == [[1.0], [2.0], [3.0]]
+    assert model.calls == [["x", "yy", "zzz"]]
+
+def test_errors_reach_every_caller():
+    batcher = BatchingEmbeddings(RecordingEmbeddings(), max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.embed_query("boom")
+    assert batcher.embed_query("ok") == [2.0]
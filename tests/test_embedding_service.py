@@ -0,0 +1,52 @@
+import os
+import stat
+import threading
+import time
+
+import pytest
+from app.core.config import settings
+from app.services.retrieval.embedding_service import EmbeddingServer, EmbeddingServerError, RemoteEmbeddings
+
+class FakeModel:
+    def embed_documents(self, texts):
+        if "boom" in texts:
+            raise ValueError("model failed")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+@pytest.fixture
+def client(tmp_path):
+    address = str(tmp_path / "embedding.sock")
+    threading.Thread(target=EmbeddingServer(FakeModel(), address=address).serve_forever, daemon=True).start()
+    for _ in range(100):
+        try:
+            RemoteEmbeddings(address).embed_query("ping")
+            break
+        except ConnectionError:
+            time.sleep(0.02)
+    return RemoteEmbeddings(address)
+
+def test_vectors_round_trip_through_shared_memory(client):
+    assert client.embed_query("abc") == [3.0, 1.0]
+    # Larger than the first reply segment, so the server has to grow it
+    texts = ["x" * i for i in range(20000)]
+    vectors = client.embed_documents(texts)
+    assert len(vectors) == 20000 and vectors[-1] == [19999.0, 1.0]
+
+def test_server_errors_keep_the_channel(client):
+    client.embed_query("warm")
+    assert len(client._idle) == 1
+    with pytest.raises(EmbeddingServerError):
+        client.embed_documents(["boom"])
+    assert len(client._idle) == 1
+    assert client.embed_query("ok") == [2.0, 1.0]
+
+def test_server_metrics_come_from_the_server_process(client):
+    client.embed_query("abc")
+    assert "counters" in client.server_metrics() and len(client._idle) == 1
+
+def test_server_generates_a_private_key(client):
+    assert stat.S_IMODE(os.stat(settings.EMBEDDING_SERVICE_KEY_PATH).st_mode) == 0o600
+    assert len(open(settings.EMBEDDING_SERVICE_KEY_PATH).read()) == 64
@@ -0,0 +1,56 @@
+import sqlite3
+from app.core.config import settings
+from app.services.retrieval.chunk_store import ChunkStore
+from app.services.retrieval.learned_lifecycle import DAY_SECONDS, plan_eviction
+from app.services.retrieval.retriever import PineconeRetriever
+
+NOW = 1_000 * DAY_SECONDS
+
+def usage(chunk_id, age_days, idle_days=None, hits=0):
+    return {
+        "chunk_id": chunk_id,
+        "created_at": NOW - age_days * DAY_SECONDS,
+        "last_used": None if idle_days is None else NOW - idle_days * DAY_SECONDS,
+        "hits": hits,
+    }
+
+def test_ttl_cold_and_budget():
+    rows = [
+        usage("expired", age_days=200, idle_days=1, hits=50),
+        usage("never-used", age_days=40),
+        usage("idle", age_days=60, idle_days=45, hits=3),
+        usage("recent-a", age_days=10, idle_days=5, hits=1),
+        usage("recent-b", age_days=10, idle_days=2, hits=9),
+        usage("fresh", age_days=1),
+    ]
+    evict = plan_eviction(rows, now=NOW, ttl_days=180, cold_days=30, max_chunks=2)
+    assert evict == {"expired": "ttl", "never-used": "cold", "idle": "cold", "recent-a": "budget"}
+
+def test_hits_are_batched_and_archived(tmp_path):
+    store = ChunkStore(path=str(tmp_path / "chunks.sqlite3"))
+    store.put_many([
+        {"chunk_id": "learned", "content": "web snippet", "knowledge_base_type": "scheme", "is_learned": True},
+        {"chunk_id": "curated", "content": "pdf text", "knowledge_base_type": "scheme", "is_learned": False},
+    ])
+    store.record_hits(["learned", "learned"])
+    [row] = store.learned_usage()
+    assert row["chunk_id"] == "learned" and row["hits"] == 2 and row["last_used"]
+
+    store.archive_many({"learned": "cold"})
+    assert store.learned_usage() == [] and store.count() == 1
+    archived = store._conn.execute("SELECT reason, hits FROM archived_chunks").fetchone()
+    assert tuple(archived) == ("cold", 2)
+
+def test_failed_hit_flush_keeps_the_batch_and_does_not_fail_the_query(tmp_path, monkeypatch):
+    store = ChunkStore(path=str(tmp_path / "chunks.sqlite3"))
+    store.put_many([{"chunk_id": "learned", "content": "web snippet", "knowledge_base_type": "scheme", "is_learned": True}])
+    retriever = PineconeRetriever.__new__(PineconeRetriever)
+    retriever.chunk_store = store
+    monkeypatch.setattr(settings, "LEARNED_HIT_FLUSH_SECONDS", 0)
+
+    conn = store._conn
+    store._conn = sqlite3.connect(":memory:", check_same_thread=False)  # no learned_usage table
+    retriever.record_usage([{"id": "learned", "metadata": {"is_learned": True}}, {"id": "curated", "metadata": {}}])
+    store._conn = conn
+    [row] = store.learned_usage()
+    assert row["hits"] == 1
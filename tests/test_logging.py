@@ -0,0 +1,30 @@
+import json
+import logging
+
+from app.core.config import ContextFilter, JsonFormatter, SamplingFilter, bind_log_context, log_context
+
+def make_record(name="agri-cult.graph", level=logging.INFO, msg="hello %s", args=("farmer",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+def test_bound_context_is_stamped_and_restored():
+    with bind_log_context(request_id="req-1"):
+        with bind_log_context(session_id="sess-1"):
+            record = make_record()
+            ContextFilter().filter(record)
+        assert log_context.get() == {"request_id": "req-1"}
+    assert log_context.get() == {}
+    assert (record.request_id, record.session_id) == ("req-1", "sess-1")
+
+def test_json_formatter_includes_correlation_ids():
+    record = make_record()
+    with bind_log_context(request_id="req-2"):
+        ContextFilter().filter(record)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "hello farmer"
+    assert (entry["logger"], entry["request_id"], entry["session_id"]) == ("agri-cult.graph", "req-2", "-")
+
+def test_sampling_drops_info_but_never_warnings():
+    sampler = SamplingFilter({"graph": 0.0})
+    assert not sampler.filter(make_record())
+    assert sampler.filter(make_record(level=logging.WARNING))
+    assert sampler.filter(make_record(name="agri-cult.http"))
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.resilience import BulkheadFull, CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_upstream, get_breaker, get_bulkhead
+
+def test_breaker_opens_and_probes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.available()
+    assert breaker.allow() and breaker.state == "half_open"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+def test_timeout_from_deadline():
+    with pytest.raises(DeadlineExceeded):
+        call_upstream("test_slow", time.sleep, 0.5, deadline=time.time() + 0.05)
+    with pytest.raises(DeadlineExceeded):
+        call_upstream("test_slow", time.sleep, 0.01, deadline=time.time() - 1)
+
+def test_open_circuit_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_THRESHOLD", 1)
+
+    def boom():
+        raise ValueError("down")
+
+    with pytest.raises(ValueError):
+        call_upstream("test_down", boom)
+    with pytest.raises(CircuitOpenError):
+        call_upstream("test_down", boom)
+    assert get_breaker("test_down").snapshot()["state"] == "open"
+
+def test_hedged_request_wins(monkeypatch):
+    monkeypatch.setattr(settings, "HEDGED_DEPENDENCIES", ["test_hedge"])
+    for _ in range(20):
+        metrics.observe("upstream.test_hedge.latency_ms", 10)
+
+    calls = []
+    def first_call_is_slow():
+        calls.append(1)
+        time.sleep(0.5 if len(calls) == 1 else 0)
+        return len(calls)
+
+    start = time.perf_counter()
+    assert call_upstream("test_hedge", first_call_is_slow) == 2
+    assert time.perf_counter() - start < 0.4
+
+def test_expired_deadline_does_not_strand_half_open_probe(monkeypatch):
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "BREAKER_RESET_SECONDS", 0.05)
+
+    def boom():
+        raise ValueError("down")
+
+    with pytest.raises(ValueError):
+        call_upstream("test_probe", boom)
+    time.sleep(0.06)
+    with pytest.raises(DeadlineExceeded):
+        call_upstream("test_probe", boom, deadline=time.time() - 1)
+    assert get_breaker("test_probe").state != "half_open"
+    assert call_upstream("test_probe", lambda: "recovered") == "recovered"
+
+def test_bulkhead_isolates_a_hanging_dependency(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_CONCURRENCY", {"test_hang": 1})
+    monkeypatch.setattr(settings, "UPSTREAM_TIMEOUTS", {"test_hang": 0.05})
+
+    with pytest.raises(DeadlineExceeded):
+        call_upstream("test_hang", time.sleep, 0.3)
+    # The abandoned call still holds the only slot
+    with pytest.raises(BulkheadFull):
+        call_upstream("test_hang", time.sleep, 0)
+    assert call_upstream("test_other", lambda: "ok") == "ok"
+
+def test_bulkhead_rejections_do_not_open_the_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_CONCURRENCY", {"test_busy": 1})
+    monkeypatch.setattr(settings, "BREAKER_FAILURE_THRESHOLD", 2)
+
+    get_bulkhead("test_busy").submit(time.sleep, 0.2)
+    for _ in range(5):
+        with pytest.raises(BulkheadFull):
+            call_upstream("test_busy", lambda: "ok")
+    assert get_breaker("test_busy").state == "closed"
@@ -0,0 +1,45 @@
+import pytest
+from pydantic import ValidationError
+from app.core.config import settings
+from app.services.llm.router import RouteRule, load_policy, question_complexity, select_route
+
+POLICY = [
+    RouteRule(name="out_of_scope", model="fast", intents=["out_of_scope"]),
+    RouteRule(name="simple", model="fast", intents=["disease"], max_context_chars=100, max_complexity=1),
+]
+
+def test_question_complexity():
+    assert question_complexity("What causes canker?") == 0
+    assert question_complexity("Why does canker spread and which schemes help? Is there a subsidy?") >= 3
+
+def test_select_route(monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_ROUTING", True)
+    assert select_route("out_of_scope", "NOT_APPLICABLE", "Who won the match?", POLICY).name == "out_of_scope"
+    assert select_route("disease", "short context", "What causes canker?", POLICY).name == "simple"
+    assert select_route("disease", "x" * 500, "What causes canker?", POLICY).name == "default"
+    assert select_route("scheme", "short context", "What schemes exist?", POLICY).name == "default"
+
+def test_routing_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_ROUTING", False)
+    assert select_route("out_of_scope", "", "hi", POLICY).model == settings.GROQ_MODEL
+
+def test_default_policy_routes_a_full_single_intent_retrieval(monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_ROUTING", True)
+    source = "\n--- SOURCE: CitrusPlantPestsAndDiseases.pdf (Page 12) ---\n" + "x" * 1000 + "\n"
+    assert select_route("disease", source * 3, "What causes canker?").name == "simple"
+    assert select_route("disease", source * 4, "What causes canker?").name == "default"
+
+def test_comparisons_never_take_the_fast_route(monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_ROUTING", True)
+    for question in (
+        "What is the difference between canker and greening?",
+        "Compare copper spray versus streptomycin for canker",
+        "Why do leaves curl?",
+    ):
+        assert select_route("disease", "short context", question).name == "default"
+    assert select_route("disease", "short context", "What causes canker?").name == "simple"
+
+def test_malformed_policy_is_rejected_when_loaded(monkeypatch):
+    monkeypatch.setattr(settings, "GENERATION_ROUTING_POLICY", [{"name": "missing-model"}])
+    with pytest.raises(ValidationError):
+        load_policy()
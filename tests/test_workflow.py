@@ -0,0 +1,161 @@
+from concurrent.futures import Future
+
+import pytest
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.graph import workflow
+from app.services.graph.workflow import ContextGrader, SearchBudget
+
+def chunk(chunk_id, score, tag):
+    return {"id": chunk_id, "score": score, "content": f"{chunk_id} " + "x" * 60, "metadata": {"document_name": tag}}
+
+INDEX = {
+    "disease": [chunk("d1", 0.9, "disease"), chunk("d2", 0.5, "disease"), chunk("d3", 0.4, "disease")],
+    "scheme": [chunk("s1", 0.8, "scheme"), chunk("s2", 0.3, "scheme")],
+    "hybrid": [chunk("h1", 0.7, "hybrid")],
+}
+
+class StubRetriever:
+    def __init__(self):
+        self.used = []
+
+    def record_usage(self, results):
+        self.used += [res["id"] for res in results]
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Workflow with upstream calls replaced; records which retrievals ran."""
+    calls = []
+    retriever = StubRetriever()
+
+    def retrieve(question, tag, top_k, deadline=None):
+        calls.append(tag)
+        return INDEX[tag][:top_k]
+
+    monkeypatch.setattr(workflow, "_retrieve", retrieve)
+    monkeypatch.setattr(workflow, "_grade", lambda prompt, deadline=None: ContextGrader(is_sufficient=True, reason="ok"))
+    monkeypatch.setattr(workflow, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH", False)
+    return calls, retriever
+
+def test_hybrid_merges_every_knowledge_base_by_score(graph):
+    calls, retriever = graph
+    state = workflow.retrieve_node({"question": "q", "intent": "hybrid", "speculative_results": None})
+    assert sorted(calls) == ["disease", "hybrid", "scheme"]
+    assert retriever.used == ["d1", "s1", "h1", "d2"]
+    assert [source["document"] for source in state["sources"]] == ["disease", "scheme", "hybrid", "disease"]
+
+class LazyFuture(Future):
+    """Runs its call only when the result is asked for, so unused ones stay cancellable."""
+
+    def __init__(self, fn, args, kwargs):
+        super().__init__()
+        self._call = (fn, args, kwargs)
+
+    def result(self, timeout=None):
+        if not self.done():
+            fn, args, kwargs = self._call
+            try:
+                self.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                self.set_exception(e)
+        return super().result(timeout)
+
+@pytest.fixture
+def speculative(graph, monkeypatch):
+    monkeypatch.setattr(settings, "SPECULATIVE_RETRIEVAL", True)
+    monkeypatch.setattr(workflow, "submit_background", lambda fn, *args, **kwargs: LazyFuture(fn, args, kwargs))
+    metrics.reset()
+
+    def classify(intent):
+        monkeypatch.setattr(workflow, "_classify", lambda question, deadline=None: intent)
+        return workflow.classify_intent_node({"question": "q"})
+    return classify
+
+def test_speculation_keeps_the_needed_search_and_cancels_the_other(graph, speculative):
+    calls, retriever = graph
+    state = speculative("disease")
+    assert state["intent"] == "disease"
+    assert [res["id"] for res in state["speculative_results"]["disease"]] == ["d1", "d2", "d3"]
+    assert "scheme" not in state["speculative_results"]
+    assert calls == ["disease"]
+    assert metrics.snapshot()["counters"]["speculative_retrieval.cancelled_searches"] == 1
+
+    workflow.retrieve_node({"question": "q", **state})
+    assert calls == ["disease"]  # answered from the speculative results
+    assert retriever.used == ["d1", "d2", "d3"]
+
+def test_out_of_scope_discards_every_speculative_search(graph, speculative):
+    calls, retriever = graph
+    state = speculative("out_of_scope")
+    assert calls == []
+    assert metrics.snapshot()["counters"]["speculative_retrieval.wasted_searches"] == 2
+
+    assert workflow.retrieve_node({"question": "q", **state})["context"] == "NOT_APPLICABLE"
+    assert retriever.used == []
+
+def test_search_budget_earns_and_caps():
+    budget = SearchBudget(earn_per_request=0.5, max_balance=2)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    budget.earn()
+    assert not budget.try_spend()
+    budget.earn()
+    assert budget.try_spend()
+    for _ in range(10):
+        budget.earn()
+    assert budget.balance == 2
+
+def test_borderline_score_band(monkeypatch):
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH_MIN_SCORE", 0.4)
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH_MAX_SCORE", 0.6)
+    assert workflow._is_borderline([{"score": 0.3}, {"score": 0.5}])
+    assert not workflow._is_borderline([{"score": 0.5}, {"score": 0.9}])
+    assert not workflow._is_borderline([{"score": 0.2}])
+    assert not workflow._is_borderline([{"score": None}])
+
+@pytest.fixture
+def prefetching(graph, monkeypatch):
+    searches = []
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH", True)
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH_MIN_SCORE", 0.5)
+    monkeypatch.setattr(settings, "SPECULATIVE_SEARCH_MAX_SCORE", 0.95)
+    monkeypatch.setattr(workflow, "search_budget", SearchBudget(earn_per_request=0, max_balance=1))
+    monkeypatch.setattr(workflow, "submit_background", lambda fn, *args, **kwargs: LazyFuture(fn, args, kwargs))
+    monkeypatch.setattr(workflow, "_web_search", lambda question, deadline=None: searches.append(question) or [{"content": "web", "url": "u"}])
+    metrics.reset()
+
+    def retrieve(sufficient):
+        monkeypatch.setattr(workflow, "_grade", lambda prompt, deadline=None: ContextGrader(is_sufficient=sufficient, reason="-"))
+        return workflow.retrieve_node({"question": "q", "intent": "disease", "speculative_results": None})
+    return retrieve, searches
+
+def test_prefetched_search_is_used_when_the_grader_rejects(prefetching):
+    retrieve, searches = prefetching
+    state = retrieve(sufficient=False)
+    assert state["search_triggered"] and state["prefetched_search"] == [{"content": "web", "url": "u"}]
+    assert searches == ["q"]
+    assert metrics.snapshot()["counters"]["speculative_search.hits"] == 1
+
+def test_prefetched_search_is_dropped_when_the_grader_accepts(prefetching):
+    retrieve, searches = prefetching
+    state = retrieve(sufficient=True)
+    assert not state["search_triggered"] and state["prefetched_search"] is None
+    assert searches == []
+    assert metrics.snapshot()["counters"]["speculative_search.wasted"] == 1
+
+def test_prefetch_is_skipped_once_the_budget_is_spent(prefetching):
+    retrieve, searches = prefetching
+    retrieve(sufficient=False)
+    state = retrieve(sufficient=False)
+    assert state["search_triggered"] and state["prefetched_search"] is None
+    assert metrics.snapshot()["counters"]["speculative_search.over_budget"] == 1
+
+def test_failed_prefetch_leaves_the_search_to_the_search_node(prefetching, monkeypatch):
+    retrieve, _ = prefetching
+    def fail(question, deadline=None):
+        raise TimeoutError("tavily")
+    monkeypatch.setattr(workflow, "_web_search", fail)
+    state = retrieve(sufficient=False)
+    assert state["search_triggered"] and state["prefetched_search"] is None
+    assert "speculative_search.hits" not in metrics.snapshot()["counters"]